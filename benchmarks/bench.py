@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(parent, "..", "src"))
+
+import click
+
+from document_helpers import filename, tags
+from document_helpers.ingest import discover
+from document_helpers.rules import Rules
+
+WORDS = ["Rechnung", "Scan", "Steuer FR", "Über", "Kündigung", "invoice", "a b c"]
+TAGS = ["google", "invoice", "Steuer FR", "tag-dashed", "Gewerbe", "CERN", "Ärzte"]
+
+FAKE_TAG = """#!/bin/sh
+if [ "$1" = "--list" ]; then
+    shift 2
+    for f in "$@"; do
+        printf '%s\\tgoogle,invoice\\n' "$f"
+    done
+fi
+"""
+
+
+def make_names(n, seed=42):
+    rng = random.Random(seed)
+    names = []
+    for i in range(n):
+        kind = i % 10
+        name = "{} {}".format(rng.choice(WORDS), i)
+        if kind == 0:
+            # pathological: long name, separators but no valid tag suffix
+            name = "--".join(rng.choice(WORDS) for _ in range(20)) + "__.pdf"
+        elif kind == 1:
+            name = name + ".pdf"
+        else:
+            dt = "{:04d}-{:02d}-{:02d}--".format(
+                rng.randint(2000, 2023), rng.randint(1, 12), rng.randint(1, 28)
+            )
+            suffix = "_".join(rng.sample(TAGS, rng.randint(1, 3)))
+            name = "{}{}__{}.pdf".format(dt, name, suffix)
+        names.append(name)
+    return names
+
+
+def make_tree(root, n, fanout=20):
+    names = make_names(n)
+    for i, name in enumerate(names):
+        d = os.path.join(root, str(i // fanout % fanout), str(i // fanout**2))
+        os.makedirs(d, exist_ok=True)
+        open(os.path.join(d, name.replace("/", "_")), "w").close()
+    return names
+
+
+def make_fake_tag(directory):
+    exe = os.path.join(directory, "tag")
+    with open(exe, "w") as fh:
+        fh.write(FAKE_TAG)
+    os.chmod(exe, os.stat(exe).st_mode | stat.S_IEXEC)
+    return exe
+
+
+def measure(label, n, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    # tracing slows everything down, so measure memory in a separate run
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        "{:<32} {:>9} {:>14.0f} ops/s {:>10.1f} MiB peak".format(
+            label, n, n / elapsed, peak / 2**20
+        )
+    )
+
+
+def bench_filename(n):
+    names = make_names(n)
+
+    def parse():
+        for name in names:
+            try:
+                filename.parse_filename(name)
+            except RuntimeError:
+                pass
+
+    def parse_cold():
+        filename._parse.cache_clear()
+        parse()
+
+    def parse_many():
+        filename._parse.cache_clear()
+        return sum(1 for _ in filename.parse_filenames(names))
+
+    measure("parse_filename (cold)", n, parse_cold)
+    measure("parse_filename (warm)", n, parse)
+    measure("parse_filenames", n, parse_many)
+
+    dt = datetime(2018, 8, 17)
+    measure(
+        "format_filename",
+        n,
+        lambda: [filename.format_filename(name, dt, TAGS[:2]) for name in names],
+    )
+
+
+def bench_rules(n, n_rules=300):
+    rng = random.Random(42)
+    rules = Rules(
+        ignore=[f"ignored {i}" for i in range(n_rules // 3)],
+        aliases={f"alias {i}": f"tag {i}" for i in range(n_rules // 3)},
+        correspondents={f"C{i}": [f"corr {i}"] for i in range(n_rules // 3)},
+        patterns=[{"match": rf"\d{{4}}-{i:02d}", "ignore": True} for i in range(12)],
+    )
+    vocabulary = TAGS + [f"alias {i}" for i in range(50)] + ["corr 1", "2021-03"]
+    tag_sets = [set(rng.sample(vocabulary, 3)) for _ in range(n)]
+    measure("Rules.apply", n, lambda: [rules.apply(tags) for tags in tag_sets])
+
+
+def bench_tree(n, workdir):
+    root = os.path.join(workdir, "tree")
+    make_tree(root, n)
+    measure("discover", n, lambda: sum(1 for _ in discover(root)))
+    return root
+
+
+def bench_tags(n, workdir, root):
+    exe = make_fake_tag(workdir)
+    paths = [str(p) for _, p in zip(range(n), discover(root))]
+
+    measure(
+        "get_tags (tag, per file)",
+        min(n, 200),
+        lambda: [tags.get_tags(p, tags_exe=exe) for p in paths[:200]],
+    )
+    measure("get_tags_many (tag)", n, lambda: tags.get_tags_many(paths, tags_exe=exe))
+
+    if tags.have_xattr():
+        try:
+            tags.xattr_set_tags(paths[0], {"google"})
+        except OSError:
+            return
+        measure(
+            "xattr_set_tags",
+            n,
+            lambda: [tags.xattr_set_tags(p, {"google", "invoice"}) for p in paths],
+        )
+        measure("xattr_get_tags", n, lambda: [tags.xattr_get_tags(p) for p in paths])
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="1000,100000",
+    help="Comma separated corpus sizes, e.g. 1000,100000,1000000",
+)
+@click.option("--tree-size", default=10000, help="Number of files in the test tree")
+def main(sizes, tree_size):
+    for n in [int(s) for s in sizes.split(",")]:
+        print(f"--- filenames: {n}")
+        bench_filename(n)
+        bench_rules(n)
+
+    workdir = tempfile.mkdtemp(prefix="document_helpers_bench_")
+    try:
+        print(f"--- tree: {tree_size}")
+        root = bench_tree(tree_size, workdir)
+        bench_tags(tree_size, workdir, root)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,14 +13,16 @@ setup(
     license="MIT",
     install_requires=[
         "click",
-        "coloredlogs"
+        "coloredlogs",
+        "tomli; python_version < '3.11'"
     ],
     tests_require=tests_require,
-    extras_require={"dev": dev_requires, "test": tests_require},
+    extras_require={"dev": dev_requires, "test": tests_require, "async": ["httpx[http2]"]},
     entry_points={"console_scripts": [
       "sync_tags=document_helpers.sync_tags:main",
       "sort_docs=document_helpers.sort:main"
     ]},
     packages=find_packages("src"),
     package_dir={"": "src"},
+    package_data={"document_helpers": ["rules.toml"]},
 )
@@ -0,0 +1,206 @@
+import asyncio
+import email.utils
+import itertools
+import math
+import time
+
+from .api import PAGE_SIZE, RateLimiter, format_stats
+from .metrics import metrics
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# httpcore's async pool looks at every connection for each queued request,
+# which gets expensive with many connections in one pool. Requests are spread
+# over several small clients instead, with HTTP/2 each of them multiplexes its
+# share over a single connection.
+SHARD_SIZE = 4
+
+
+def have_httpx():
+    return httpx is not None
+
+
+def _retry_after(r):
+    value = r.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(
+            0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncPaperlessClient:
+    # the asyncio counterpart of PaperlessClient, one event loop can keep
+    # hundreds of requests in flight
+    def __init__(
+        self, url, token, concurrency=100, retries=5, rate=None, transport=None
+    ):
+        if httpx is None:
+            raise RuntimeError(
+                "The async engine needs httpx, install document_helpers[async]"
+            )
+        self.url = url.rstrip("/")
+
+        shards = math.ceil(concurrency / SHARD_SIZE)
+        size = math.ceil(concurrency / shards)
+        self.clients = [
+            httpx.AsyncClient(
+                base_url=self.url,
+                headers={"Authorization": f"Token {token}"},
+                http2=h2 is not None,
+                limits=httpx.Limits(
+                    max_connections=size, max_keepalive_connections=size
+                ),
+                # waiting for a free connection is expected, not an error
+                timeout=httpx.Timeout(30.0, pool=None),
+                transport=transport,
+            )
+            for _ in range(shards)
+        ]
+        self.semaphores = [asyncio.Semaphore(size) for _ in self.clients]
+        self.next_shard = itertools.count()
+
+        self.retries = retries
+        self.limiter = RateLimiter(rate) if rate is not None else None
+        self.stats = {"requests": 0, "errors": 0, "seconds": 0.0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        for client in self.clients:
+            await client.aclose()
+
+    async def _acquire_rate(self):
+        while True:
+            delay = self.limiter.take()
+            if delay == 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _count(self, seconds, error):
+        # only ever called from the event loop thread
+        self.stats["requests"] += 1
+        self.stats["seconds"] += seconds
+        if error:
+            self.stats["errors"] += 1
+
+    async def request(self, method, path, stream=False, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self._acquire_rate()
+
+            shard = next(self.next_shard) % len(self.clients)
+            client = self.clients[shard]
+            async with self.semaphores[shard]:
+                start = time.perf_counter()
+                try:
+                    request = client.build_request(method, path, **kwargs)
+                    r = await client.send(request, stream=stream)
+                except httpx.TransportError:
+                    self._count(time.perf_counter() - start, error=True)
+                    if attempt == self.retries or method == "POST":
+                        raise
+                    await asyncio.sleep(0.5 * 2**attempt)
+                    continue
+
+            seconds = time.perf_counter() - start
+            self._count(seconds, error=r.status_code >= 400)
+            metrics.observe_request(method, path, seconds)
+
+            # same policy as the requests based client: POSTs are not retried
+            if (
+                r.status_code in RETRY_STATUS
+                and attempt < self.retries
+                and method != "POST"
+            ):
+                await r.aclose()
+                delay = _retry_after(r)
+                await asyncio.sleep(delay if delay is not None else 0.5 * 2**attempt)
+                continue
+
+            return r
+
+    def summary(self):
+        return format_stats(self.stats)
+
+
+async def probe_document(client, doc, probe="head"):
+    doc_url = f"/api/documents/{doc['id']}/download/"
+    start = time.perf_counter()
+
+    # don't let the server start sending the whole file
+    if probe == "head":
+        r = await client.request("HEAD", doc_url)
+    else:
+        r = await client.request(
+            "GET", doc_url, headers={"Range": "bytes=0-0"}, stream=True
+        )
+        if r.status_code == 206:
+            # read the single byte so the connection goes back to the pool
+            await r.aread()
+    await r.aclose()
+    seconds = time.perf_counter() - start
+
+    return doc, r.status_code in (200, 206), r.status_code, seconds
+
+
+async def probe_documents(client, docs, on_result, probe="head", concurrency=100):
+    # docs is a blocking iterator (paged listing, check state lookups), pull it
+    # in batches on a worker thread so the event loop keeps probing meanwhile
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    it = iter(docs)
+
+    async def produce():
+        while True:
+            batch = await loop.run_in_executor(
+                None, list, itertools.islice(it, PAGE_SIZE)
+            )
+            if len(batch) == 0:
+                break
+            for doc in batch:
+                await queue.put(doc)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            doc = await queue.get()
+            if doc is None:
+                return
+            on_result(*await probe_document(client, doc, probe))
+
+    await asyncio.gather(produce(), *[work() for _ in range(concurrency)])
+
+
+def check_documents(
+    url, token, docs, on_result, probe="head", concurrency=100, rate=None
+):
+    async def run():
+        async with AsyncPaperlessClient(
+            url, token, concurrency=concurrency, rate=rate
+        ) as client:
+            await probe_documents(
+                client, docs, on_result, probe=probe, concurrency=concurrency
+            )
+            return client.summary()
+
+    return asyncio.run(run())
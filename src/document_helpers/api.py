@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
+
+from .metrics import metrics
+from .pool import bounded_map
+
+PAGE_SIZE = 500
+
+
+class RateLimiter:
+    # token bucket: `rate` requests per second with bursts up to `burst`
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # returns how long to wait before trying again, 0 if we got a token
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            delay = self.take()
+            if delay == 0:
+                return
+            time.sleep(delay)
+
+
+def format_stats(stats):
+    n = stats["requests"]
+    mean = stats["seconds"] / n * 1000 if n > 0 else 0
+    return (
+        f"{n} requests, {stats['errors']} errors, "
+        f"{stats['seconds']:.1f}s total, {mean:.0f}ms mean"
+    )
+
+
+class PaperlessClient:
+    def __init__(
+        self, url, token, max_connections=10, retries=5, rate=None, cache=None
+    ):
+        self.url = url.rstrip("/")
+        self.token = token
+
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Token {token}"
+        # POSTs are not retried by default, we don't want duplicate uploads
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max_connections, max_retries=retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.semaphore = threading.BoundedSemaphore(max_connections)
+        self.limiter = RateLimiter(rate) if rate is not None else None
+        self.cache = cache
+
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "seconds": 0.0}
+
+    def request(self, method, path, **kwargs):
+        url = path if path.startswith("http") else f"{self.url}{path}"
+
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+        with self.semaphore:
+            start = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                self._count(time.perf_counter() - start, error=True)
+                raise
+
+        seconds = time.perf_counter() - start
+        self._count(seconds, error=r.status_code >= 400)
+        metrics.observe_request(method, path, seconds)
+        return r
+
+    def _count(self, seconds, error):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["seconds"] += seconds
+            if error:
+                self.stats["errors"] += 1
+
+    def summary(self):
+        return format_stats(self.stats)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def get_json(self, path, **kwargs):
+        r = self.get(path, **kwargs)
+        r.raise_for_status()
+        return r.json()
+
+    def create(self, endpoint, data):
+        r = self.post(f"/api/{endpoint}/", data=data)
+        if r.status_code == 400 and self.cache is not None:
+            # usually the name exists already, so the cached map is stale
+            self.cache.invalidate(endpoint)
+        r.raise_for_status()
+        obj_id = r.json()["id"]
+        if self.cache is not None and "name" in data:
+            self.cache.add(endpoint, data["name"], obj_id)
+        return obj_id
+
+    def get_page(self, endpoint, page=1, page_size=PAGE_SIZE, **params):
+        return self.get_json(
+            f"/api/{endpoint}/",
+            params={"page": page, "page_size": page_size, **params},
+        )
+
+    def get_count(self, endpoint, **params):
+        return self.get_page(endpoint, page_size=1, **params)["count"]
+
+    def iter_results(self, endpoint, page_size=PAGE_SIZE, jobs=1, **params):
+        data = self.get_page(endpoint, page_size=page_size, **params)
+        yield from data["results"]
+
+        if data["next"] is None:
+            return
+
+        if jobs > 1 and data.get("count") is not None:
+            # we know how many pages there are, so fetch the rest side by side
+            pages = range(2, math.ceil(data["count"] / page_size) + 1)
+
+            def fetch(page):
+                return self.get_page(
+                    endpoint, page=page, page_size=page_size, **params
+                )["results"]
+
+            for results in bounded_map(fetch, pages, jobs):
+                yield from results
+            return
+
+        next_url = data["next"]
+        while next_url is not None:
+            data = self.get_json(next_url)
+            yield from data["results"]
+            next_url = data["next"]
+
+    def get_name_map(self, endpoint, refresh=False):
+        if self.cache is not None and not refresh:
+            items = self.cache.get(endpoint)
+            if items is not None:
+                return items
+
+        items = {c["name"]: c["id"] for c in self.iter_results(endpoint)}
+        if self.cache is not None:
+            self.cache.put(endpoint, items)
+        return items
+
+    def get_metadata(self, doc_id):
+        return self.get_json(f"/api/documents/{doc_id}/metadata/")
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(base) / "document_helpers"
+
+
+def server_key(url):
+    return hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:16]
+
+
+def remote_state_path(url, directory=None):
+    # checksums of the documents on a server, for runs without --state
+    directory = Path(directory) if directory is not None else default_cache_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"remote-{server_key(url)}.db"
+
+
+class MetadataCache:
+    # name -> id maps per endpoint, one json file per server
+    def __init__(self, url, ttl=3600, directory=None):
+        self.ttl = ttl
+        directory = Path(directory) if directory is not None else default_cache_dir()
+        self.path = directory / f"metadata-{server_key(url)}.json"
+        self.lock = threading.Lock()
+
+        try:
+            with open(self.path) as fh:
+                self.data = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            self.data = {}
+
+    def get(self, endpoint):
+        with self.lock:
+            entry = self.data.get(endpoint)
+            if entry is None or time.time() - entry["fetched"] > self.ttl:
+                return None
+            return dict(entry["items"])
+
+    def put(self, endpoint, items):
+        with self.lock:
+            self.data[endpoint] = {"fetched": time.time(), "items": dict(items)}
+            self._save()
+
+    def add(self, endpoint, name, obj_id):
+        with self.lock:
+            entry = self.data.get(endpoint)
+            if entry is None:
+                return
+            entry["items"][name] = obj_id
+            self._save()
+
+    def invalidate(self, endpoint=None):
+        with self.lock:
+            if endpoint is None:
+                self.data = {}
+            else:
+                self.data.pop(endpoint, None)
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(self.data, fh)
+        os.replace(tmp, self.path)
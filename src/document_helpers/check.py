@@ -1,33 +1,282 @@
 import typer
-import requests
 import rich.console
 import rich.panel
 import rich.table
 import rich.progress
 
+import json
+import os
 import shutil
+import sys
+import time
+from enum import Enum
 from pathlib import Path
 from typing import Optional, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import aio
+from .api import PaperlessClient
+from .checksum import md5sum
+from .journal import CheckState
+from .metrics import metrics
+from .pool import bounded_map, process_pool
 
 
 console = rich.console.Console()
 
 app = typer.Typer()
 
-def get_all_tags(url, token):
-    url = f"{url}/api/tags/?page_size=100000"
 
-    r = requests.get(
-        url,
-        headers={"Authorization": f"Token {token}"},
-    )
+class Probe(str, Enum):
+    head = "head"
+    range = "range"
+
+
+class Engine(str, Enum):
+    threads = "threads"
+    asyncio = "async"
+
+
+class Format(str, Enum):
+    table = "table"
+    json = "json"
+    ndjson = "ndjson"
+
+
+def percentile(values, p):
+    # values need to be sorted
+    if len(values) == 0:
+        return None
+    return round(values[round(p / 100 * (len(values) - 1))], 6)
+
+
+class Reporter:
+    def __init__(self, fmt=Format.table):
+        self.fmt = fmt
+        self.results = []
+        self.latencies = []
+        self.start = time.perf_counter()
+        # keep stdout machine readable, progress goes to stderr
+        self.console = (
+            console if fmt == Format.table else rich.console.Console(stderr=True)
+        )
+
+    @property
+    def table(self):
+        return self.fmt == Format.table
+
+    def result(self, record, seconds=None):
+        if seconds is not None:
+            self.latencies.append(seconds)
+            record["seconds"] = round(seconds, 6)
+        if self.fmt == Format.ndjson:
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+        elif self.fmt == Format.json:
+            self.results.append(record)
+
+    def summary(self, **extra):
+        elapsed = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+        summary = {
+            "checked": len(latencies),
+            "seconds": round(elapsed, 3),
+            "per_second": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+            "latency": {f"p{p}": percentile(latencies, p) for p in (50, 90, 99)},
+            **extra,
+        }
+        summary["latency"]["max"] = percentile(latencies, 100)
+        return summary
+
+    def finish(self, **extra):
+        summary = self.summary(**extra)
+        if self.fmt == Format.ndjson:
+            print(json.dumps({"summary": summary}))
+        elif self.fmt == Format.json:
+            print(json.dumps({"results": self.results, "summary": summary}, indent=2))
+        else:
+            latency = summary["latency"]
+            ms = {k: v * 1000 if v is not None else 0 for k, v in latency.items()}
+            self.console.print(
+                f"{summary['checked']} checked in {summary['seconds']:.1f}s "
+                f"({summary['per_second'] or 0:.1f}/s), latency "
+                f"p50 {ms['p50']:.0f}ms, p90 {ms['p90']:.0f}ms, "
+                f"p99 {ms['p99']:.0f}ms, max {ms['max']:.0f}ms"
+            )
+        return summary
+
+
+def expected_files(doc_id, meta, originals, archive):
+    # paperless keeps originals and archive versions under their media names
+    if originals is not None:
+        yield (
+            doc_id,
+            "original",
+            str(originals / meta["media_filename"]),
+            meta.get("original_size"),
+            meta["original_checksum"],
+        )
+    if archive is not None and meta.get("has_archive_version"):
+        yield (
+            doc_id,
+            "archive",
+            str(archive / meta["archive_media_filename"]),
+            meta.get("archive_size"),
+            meta["archive_checksum"],
+        )
+
+
+def _verify(path, size, checksum):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
 
-    r.raise_for_status()
+    if size is not None and st.st_size != size:
+        return "size mismatch"
 
-    data = r.json()
+    if md5sum(path) != checksum:
+        return "checksum mismatch"
+
+    return "ok"
+
+
+def verify_file(item):
+    doc_id, kind, path, size, checksum = item
+    start = time.perf_counter()
+    status = _verify(path, size, checksum)
+    return doc_id, kind, path, status, time.perf_counter() - start
+
+
+def recovery_candidates(doc_id, meta, originals, archive):
+    # the same paths and checksums --offline verifies, as (path, checksum)
+    found = {
+        kind: (Path(path), checksum)
+        for _, kind, path, _, checksum in expected_files(
+            doc_id, meta, originals, archive
+        )
+    }
+    return found.get("original", (None, None)), found.get("archive", (None, None))
+
+
+def unique_name(name, doc_id, used):
+    # broken documents can share a file name, but not a recovered file
+    while name in used:
+        path = Path(name)
+        name = f"{path.stem}--{doc_id}{path.suffix}"
+    used.add(name)
+    return name
+
+
+def fast_copy(src, dst):
+    # copy_file_range lets the kernel copy (or reflink) without going through
+    # user space, shutil.copyfile falls back to sendfile
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            while copied < size:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+        if copied < size:
+            raise OSError("short copy")
+    except (AttributeError, OSError):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def recover_file(item):
+    with metrics.phase("recover"):
+        return _recover_file(item)
+
+
+def _recover_file(item):
+    doc_id, src, dest, checksum, link = item
+    if dest.exists():
+        dest.unlink()
+
+    if link:
+        try:
+            os.link(src, dest)
+        except OSError:
+            # different file systems
+            fast_copy(src, dest)
+    else:
+        fast_copy(src, dest)
+
+    ok = checksum is None or md5sum(dest) == checksum
+    return doc_id, dest, ok
+
+
+def select_documents(client, check_state=None, full=False):
+    docs = client.iter_results("documents", jobs=4, fields="id,modified")
+    docs = metrics.timed("list_documents", docs)
+    if check_state is None or full:
+        return client.get_count("documents"), docs
+
+    docs = list(check_state.select(docs))
+    return len(docs), docs
+
+
+def check_offline(
+    client, docs, count, originals, archive, concurrency, check_state, reporter
+):
+    def fetch(doc):
+        return doc, client.get_metadata(doc["id"])
+
+    files = []
+    checked = {}
+    for doc, meta in rich.progress.track(
+        bounded_map(fetch, docs, concurrency),
+        description=f"[bold green]Getting metadata for {count} documents...",
+        console=reporter.console,
+        total=count,
+    ):
+        checked[doc["id"]] = (doc.get("modified"), meta["original_checksum"])
+        files.extend(expected_files(doc["id"], meta, originals, archive))
+
+    problems = []
+    for doc_id, kind, path, status, seconds in rich.progress.track(
+        bounded_map(
+            verify_file,
+            files,
+            os.cpu_count() or 1,
+            executor_class=process_pool,
+        ),
+        description=f"[bold green]Verifying {len(files)} files...",
+        console=reporter.console,
+        total=len(files),
+    ):
+        metrics.observe("verify", seconds)
+        reporter.result(
+            {"id": doc_id, "kind": kind, "path": path, "status": status}, seconds
+        )
+        if status != "ok":
+            problems.append((doc_id, kind, path, status))
+
+    if check_state is not None:
+        broken = {doc_id for doc_id, _, _, _ in problems}
+        for doc_id, (modified, checksum) in checked.items():
+            check_state.record(doc_id, modified, doc_id not in broken, checksum)
+
+    if reporter.table:
+        table = rich.table.Table("Document", "Kind", "Path", "Problem")
+        for doc_id, kind, path, status in sorted(problems):
+            table.add_row(str(doc_id), kind, path, status)
+        if len(problems) > 0:
+            console.print(table)
+        console.print(f"{len(files)} files checked, {len(problems)} problems")
+
+    return problems
+
+
+def report_metrics(console, timings, metrics_file):
+    if timings:
+        console.print(metrics.summary(), highlight=False, soft_wrap=True)
+    if metrics_file is not None:
+        metrics.export(metrics_file)
 
-    return {c["name"]: c["id"] for c in data["results"]}
 
 @app.command()
 def main(
@@ -37,9 +286,68 @@ def main(
     archive: Optional[Path] = typer.Option(None, exists=True, file_okay=False),
     output: Optional[Path] = typer.Option(None, exists=True, file_okay=False),
     recover: bool = False,
+    rate: Optional[float] = typer.Option(None, help="Maximum API requests per second"),
+    concurrency: int = typer.Option(
+        10,
+        min=1,
+        help="Number of documents checked at the same time, "
+        "the async engine handles hundreds",
+    ),
+    engine: Engine = typer.Option(
+        Engine.threads,
+        help="Probe downloads from a thread pool or an asyncio event loop (needs httpx)",
+    ),
+    probe: Probe = typer.Option(
+        Probe.head, help="Probe downloads with HEAD or a one byte range request"
+    ),
+    offline: bool = typer.Option(
+        False,
+        help="Verify files in --originals/--archive on disk instead of downloading",
+    ),
+    state: Optional[Path] = typer.Option(
+        None,
+        help="Remember verified documents here and only recheck what changed",
+    ),
+    sweep_days: int = typer.Option(
+        7, min=1, help="Every document is rechecked at least this often"
+    ),
+    full: bool = typer.Option(False, help="Check every document regardless of state"),
+    link: bool = typer.Option(
+        False, help="Hardlink recovered files into --output instead of copying"
+    ),
+    output_format: Format = typer.Option(
+        Format.table, "--format", help="Print a table, a json report or json lines"
+    ),
+    timings: bool = typer.Option(False, help="Print per phase and endpoint timings"),
+    metrics_file: Optional[Path] = typer.Option(
+        None, help="Write timings as json (*.json) or a prometheus textfile"
+    ),
 ):
-    documents_url = f"{url}/api/documents/?page_size=100000"
-
+    if timings or metrics_file is not None:
+        metrics.enable()
+
+    reporter = Reporter(output_format)
+    console = reporter.console
+
+    if engine == Engine.asyncio and not aio.have_httpx():
+        console.print("[red bold]The async engine needs httpx")
+        raise typer.Exit(2)
+
+    client = PaperlessClient(url, token, max_connections=concurrency, rate=rate)
+    check_state = CheckState(state, sweep_days=sweep_days) if state else None
+
+    if offline:
+        assert (
+            originals is not None or archive is not None
+        ), "Offline checks need --originals and/or --archive"
+        count, docs = select_documents(client, check_state, full)
+        problems = check_offline(
+            client, docs, count, originals, archive, concurrency, check_state, reporter
+        )
+        reporter.finish(problems=len(problems))
+        console.print("API:", client.summary())
+        report_metrics(console, timings, metrics_file)
+        raise typer.Exit(1 if len(problems) > 0 else 0)
 
     paths = [originals, archive, output]
     assert all([p is not None for p in paths]) or not any(
@@ -47,110 +355,170 @@ def main(
     ), "Either all or none of the paths must be specified"
 
     with console.status("Getting 'broken' tags") as status:
-        tags = get_all_tags(url, token)
+        tags = client.get_name_map("tags")
         broken_tag = tags["broken"]
 
-
     with console.status("[bold green]Getting all documents") as status:
-        r = requests.get(
-            documents_url,
-            headers={"Authorization": f"Token {token}"},
-        )
-
-        # print(r.json())
-
-        def check_document(doc: dict[str, Any]) -> tuple[dict[str, Any], bool]:
-            doc_url = f"{url}/api/documents/{doc['id']}/download/"
+        count, docs = select_documents(client, check_state, full)
 
-            r = requests.get(
-                doc_url, headers={"Authorization": f"Token {token}"}, stream=True
-            )
-
-            if r.status_code == 200:
-                return doc, True
+        def check_document(
+            doc: dict[str, Any]
+        ) -> tuple[dict[str, Any], bool, int, float]:
+            doc_url = f"/api/documents/{doc['id']}/download/"
+            start = time.perf_counter()
 
+            # don't let the server start sending the whole file
+            if probe == Probe.head:
+                r = client.request("HEAD", doc_url)
             else:
-                return doc, False
+                r = client.get(doc_url, headers={"Range": "bytes=0-0"}, stream=True)
+                if r.status_code == 206:
+                    # read the single byte so the connection goes back to the pool
+                    r.content
+            r.close()
+            seconds = time.perf_counter() - start
 
-        def get_meta(doc_id: int) -> dict[str, Any]:
-            return requests.get(
-                f"{url}/api/documents/{doc_id}/metadata/",
-                headers={"Authorization": f"Token {token}"},
-            ).json()
+            return doc, r.status_code in (200, 206), r.status_code, seconds
 
-        docs = r.json()["results"]
-        print("Have", len(docs), "documents")
+        console.print("Have", count, "documents")
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        broken = []
+    broken = []
+    probe_times = {}
 
-        futures = []
+    def handle_result(doc, ok, http_status, seconds):
+        #  print(doc["id"], doc["title"])
 
-        for doc in docs:
-            futures.append(executor.submit(check_document, doc))
+        #  print("->", "OK" if ok else "BROKEN")
+        metrics.observe("probe", seconds)
 
-        for future in rich.progress.track(
-            as_completed(futures),
-            description=f"[bold green]Checking {len(docs)} documents...",
+        if check_state is not None:
+            check_state.record(doc["id"], doc.get("modified"), ok)
+
+        if ok:
+            reporter.result(
+                {"id": doc["id"], "status": "ok", "http_status": http_status},
+                seconds,
+            )
+        else:
+            # reported once we know where its files are
+            broken.append(doc["id"])
+            probe_times[doc["id"]] = (http_status, seconds)
+
+    description = f"[bold green]Checking {count} documents..."
+    if engine == Engine.asyncio:
+        with rich.progress.Progress(console=console) as progress:
+            task = progress.add_task(description, total=count)
+
+            def on_result(*result):
+                handle_result(*result)
+                progress.advance(task)
+
+            async_summary = aio.check_documents(
+                url,
+                token,
+                docs,
+                on_result,
+                probe=probe.value,
+                concurrency=concurrency,
+                rate=rate,
+            )
+        console.print("API (async):", async_summary)
+    else:
+        for result in rich.progress.track(
+            bounded_map(check_document, docs, concurrency),
+            description=description,
             console=console,
-            total=len(docs),
+            total=count,
         ):
-            doc, ok = future.result()
-
-            #  print(doc["id"], doc["title"])
-
-            #  print("->", "OK" if ok else "BROKEN")
-
-            if not ok:
-                broken.append(doc)
-
-        #  broken = [2067, 2069, 2096, 2115, 2201, 2206, 2207, 2208, 2209]
-
-        status.update(
-            f"[bold green]Getting metadata for {len(broken)} broken documents!"
+            handle_result(*result)
+
+    #  broken = [2067, 2069, 2096, 2115, 2201, 2206, 2207, 2208, 2209]
+
+    with console.status(
+        f"[bold green]Getting metadata for {len(broken)} broken documents!"
+    ):
+        broken_meta = list(
+            bounded_map(
+                lambda doc_id: (doc_id, client.get_metadata(doc_id)),
+                broken,
+                concurrency,
+            )
         )
 
-        broken_meta = list(executor.map(get_meta, broken))
+    copies = []
+    used_names = set()
+    for doc_id, meta in sorted(broken_meta, key=lambda item: item[0]):
+        (original, original_checksum), (media, media_checksum) = recovery_candidates(
+            doc_id, meta, originals, archive
+        )
+        original_found = original.exists() if original is not None else None
+        media_found = media.exists() if media is not None else None
+
+        http_status, seconds = probe_times[doc_id]
+        reporter.result(
+            {
+                "id": doc_id,
+                "status": "broken",
+                "http_status": http_status,
+                "original_filename": meta["original_filename"],
+                "media_filename": meta["media_filename"],
+                "original_path": str(original) if original else None,
+                "original_found": original_found,
+                "media_path": str(media) if media else None,
+                "media_found": media_found,
+            },
+            seconds,
+        )
 
-        for doc_id, meta in zip(broken, broken_meta):
+        if reporter.table:
             table = rich.table.Table()
             table.add_row("Original filename", meta["original_filename"])
             table.add_row("Media filename", meta["media_filename"])
             table.add_row(
                 "URL", f"https://paperless.gessinger.dev/documents/{doc_id}/"
             )
-
-            path_prefix = Path(meta["media_filename"]).parent
-
-            original = (
-                originals / path_prefix / meta["original_filename"]
-                if originals is not None
-                else None
-            )
-            media = (
-                archive / meta["media_filename"] if archive is not None else None
-            )
-
             table.add_row("Original path", str(original) if original else "N/A")
             table.add_row("Media path", str(media) if media else "N/A")
-
             table.add_row(
                 "Original found?",
-                str(original.exists()) if original is not None else "N/A",
+                str(original_found) if original is not None else "N/A",
             )
             table.add_row(
-                "Media found?", str(media.exists()) if media is not None else "N/A"
+                "Media found?", str(media_found) if media is not None else "N/A"
             )
 
             rich.print(rich.panel.Panel(table, title=f"Document #{doc_id}"))
 
-            #  print(media, media.exists())
-            if output.exists() :
-                if media.exists():
-                    shutil.copy(media, output / Path(meta["media_filename"]).name)
-                else:
-                    rich.print("[red bold]Media file not found!")
+        #  print(media, media.exists())
+        if recover and output is not None:
+            if original_found:
+                name = unique_name(meta["original_filename"], doc_id, used_names)
+                copies.append(
+                    (doc_id, original, output / name, original_checksum, link)
+                )
+            elif media_found:
+                name = unique_name(media.name, doc_id, used_names)
+                copies.append((doc_id, media, output / name, media_checksum, link))
+            else:
+                console.print(f"[red bold]No file found for document #{doc_id}!")
+
+    if len(copies) > 0:
+        failed = 0
+        for doc_id, dest, ok in rich.progress.track(
+            bounded_map(recover_file, copies, concurrency),
+            description=f"[bold green]Recovering {len(copies)} files...",
+            console=console,
+            total=len(copies),
+        ):
+            if not ok:
+                failed += 1
+                console.print(f"[red bold]Checksum mismatch for #{doc_id}: {dest}")
+        console.print(f"Recovered {len(copies) - failed} of {len(copies)} files")
+
+    #  print("---")
+    #  c = archive / "2021"/"03"/"2021-03-19--Letter_Anschreiben Vorsitz Gessinger-Befurt (ausgefüllt)__DOCT.pdf"
+    #  print(type(c), c, (c).exists())
 
-        #  print("---")
-        #  c = archive / "2021"/"03"/"2021-03-19--Letter_Anschreiben Vorsitz Gessinger-Befurt (ausgefüllt)__DOCT.pdf"
-        #  print(type(c), c, (c).exists())
+    reporter.finish(broken=len(broken))
+    console.print("API:", client.summary())
+    report_metrics(console, timings, metrics_file)
@@ -0,0 +1,15 @@
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def md5sum(path, chunk_size=CHUNK_SIZE):
+    # paperless stores md5 checksums for originals and archive files
+    h = hashlib.md5()
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
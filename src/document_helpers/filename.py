@@ -1,3 +1,4 @@
+import functools
 import os
 from datetime import datetime
 import re
@@ -20,28 +21,60 @@ def dataclass(**kwargs):
     return c
 
 
-def parse_filename(file):
-    m = re.match(
-        r"(?:^(?P<date>\d{4}-\d{2}-\d{2})--)?(?:--)?(?P<name>.*?)(?:__)?(?:(?<=__)(?P<tags>[\wÄÖÜäöü\- ]+?))?(?P<ext>\.\w+)$",
-        file,
-    )
+FILENAME_RE = re.compile(
+    r"(?:^(?P<date>\d{4}-\d{2}-\d{2})--)?(?:--)?(?P<name>.*?)(?:__)?(?:(?<=__)(?P<tags>[\wÄÖÜäöü\- ]+?))?(?P<ext>\.\w+)$"
+)
+
+
+class FileInfo:
+    __slots__ = ("dt", "name", "tags")
+
+    def __init__(self, dt, name, tags):
+        self.dt = dt
+        self.name = name
+        self.tags = tags
+
+    def __repr__(self):
+        return "FileInfo(dt={}, name={}, tags={})".format(self.dt, self.name, self.tags)
+
+    def __eq__(self, other):
+        if not isinstance(other, FileInfo):
+            return NotImplemented
+        return (self.dt, self.name, self.tags) == (other.dt, other.name, other.tags)
+
+
+def _parse_date(s):
+    # much faster than strptime for the fixed YYYY-MM-DD layout
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse(file):
+    m = FILENAME_RE.match(file)
 
     if m is None:
         raise RuntimeError("Regex did not match")
 
-    if m.group("date") is not None:
-        dt = datetime.strptime(m.group("date"), "%Y-%m-%d")
-    else:
-        dt = None
+    date, name, tags, ext = m.group("date", "name", "tags", "ext")
+
+    dt = _parse_date(date) if date is not None else None
+    tags = frozenset(tags.split("_")) if tags is not None else frozenset()
 
-    if m.group("tags") is not None:
-        tags = set(m.group("tags").split("_"))
-    else:
-        tags = set()
+    return dt, name + ext, tags
+
+
+def parse_filename(file):
+    # the cached values are immutable, callers get their own copy to modify
+    dt, name, tags = _parse(file)
+    return FileInfo(dt=dt, name=name, tags=set(tags))
 
-    name = m.group("name") + m.group("ext")
 
-    return dataclass(dt=dt, name=name, tags=tags)
+def parse_filenames(files):
+    for file in files:
+        try:
+            yield parse_filename(file)
+        except RuntimeError:
+            yield None
 
 
 def format_filename(name, dt, tags=None):
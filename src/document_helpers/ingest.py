@@ -4,20 +4,33 @@ from __future__ import print_function
 import argparse
 import glob
 import os
+from fnmatch import fnmatch
 from datetime import date, datetime
 from pathlib import Path
 import requests
 import shutil
 import sys
 import subprocess
+import threading
+import time
 
 import logging
 
 import click
 
 from .log import get_logger
-from .filename import dataclass, parse_filename, format_filename
-from .tags import get_tags, set_tags
+from .api import PaperlessClient
+from .cache import MetadataCache, remote_state_path
+from .filename import FileInfo, dataclass, parse_filename, format_filename
+from .journal import Journal
+from .metrics import metrics
+from .multipart import CHUNK_SIZE, MultipartStream
+from .pool import bounded_map, process_pool
+from .preprocess import inspect_many
+from .rules import DEFAULT_RULES, Rules
+from .tasks import TaskTracker
+from .tags import BATCH_SIZE, get_tags, get_tags_many
+from .watch import watch
 
 
 def quote(s):
@@ -72,298 +85,699 @@ logger = get_logger("sort", level)
 #  return data["id"]
 
 
-def create_tag(url, token, tag):
-    r = requests.post(
-        f"{url}/api/tags/",
-        headers={"Authorization": f"Token {token}"},
-        data={"name": tag},
-    )
+def create_tag(client, tag):
+    return client.create("tags", {"name": tag})
 
-    r.raise_for_status()
-    data = r.json()
-    return data["id"]
 
+_tag_lock = threading.Lock()
 
-def create_correspondent(url, token, correspondent):
-    print("posting correspondent:", correspondent)
-    r = requests.post(
-        f"{url}/api/correspondents/",
-        headers={"Authorization": f"Token {token}"},
-        data={
-            "name": correspondent,
-            "match": "",
-            "matching_algorithm": 6,
-            "is_sensitive": False,
-        },
-    )
 
+def ensure_tag(client, tag, tags_to_ids):
+    tag_id = tags_to_ids.get(tag)
+    if tag_id is not None:
+        return tag_id
+
+    with _tag_lock:
+        # another worker might have created it while we were waiting
+        if tag in tags_to_ids:
+            return tags_to_ids[tag]
+
+        try:
+            with metrics.phase("create_tag"):
+                tag_id = create_tag(client, tag)
+        except requests.exceptions.HTTPError:
+            # someone else created the tag on the server, pick up its id
+            tags_to_ids.update(get_all_tags(client, refresh=True))
+            if tag not in tags_to_ids:
+                raise
+            tag_id = tags_to_ids[tag]
+
+        tags_to_ids[tag] = tag_id
+        return tag_id
+
+
+def create_correspondent(client, correspondent):
+    print("posting correspondent:", correspondent)
     try:
-        r.raise_for_status()
-    except:
-        print(r.text)
+        return client.create(
+            "correspondents",
+            {
+                "name": correspondent,
+                "match": "",
+                "matching_algorithm": 6,
+                "is_sensitive": False,
+            },
+        )
+    except requests.exceptions.HTTPError as e:
+        print(e.response.text)
         raise
-    data = r.json()
-    return data["id"]
 
 
-def get_all_tags(url, token):
-    url = f"{url}/api/tags/?page_size=100000"
+def get_all_tags(client, refresh=False):
+    return client.get_name_map("tags", refresh=refresh)
 
-    r = requests.get(
-        url,
-        headers={"Authorization": f"Token {token}"},
-    )
 
-    r.raise_for_status()
+def get_correspondents(client, refresh=False):
+    return client.get_name_map("correspondents", refresh=refresh)
 
-    data = r.json()
 
-    return {c["name"]: c["id"] for c in data["results"]}
+def create_document_type(client, name):
+    return client.create("document_types", {"name": name})
 
 
-def get_correspondents(url, token):
-    url = f"{url}/api/correspondents/?page_size=100000"
+def get_document_types(client, refresh=False):
+    return client.get_name_map("document_types", refresh=refresh)
 
-    r = requests.get(
-        url,
-        headers={"Authorization": f"Token {token}"},
-    )
 
-    r.raise_for_status()
+def load_name_map(client, get, create, names, dry_run, refresh=False):
+    items = get(client, refresh=refresh)
+    # a cached map might just be stale, check with the server before creating
+    if not refresh and not names <= items.keys():
+        items = get(client, refresh=True)
 
-    data = r.json()
+    for name in sorted(names - items.keys()):
+        if not dry_run:
+            items[name] = create(client, name)
+        else:
+            items[name] = f"{name} (NEW)"
+    return items
 
-    return {c["name"]: c["id"] for c in data["results"]}
 
+def replace_items(items, fresh):
+    # in place, the upload workers hold on to these dicts
+    items.update(fresh)
+    for name in items.keys() - fresh.keys():
+        items.pop(name, None)
 
-def create_document_type(url, token, name):
-    r = requests.post(
-        f"{url}/api/document_types/",
-        headers={"Authorization": f"Token {token}"},
-        data={"name": name},
-    )
 
-    r.raise_for_status()
-    data = r.json()
-    return data["id"]
+def get_remote_documents(client, journal=None, jobs=1):
+    ids = {
+        doc["id"] for doc in client.iter_results("documents", jobs=jobs, fields="id")
+    }
 
+    # the document list does not carry checksums, so only ask for the
+    # metadata of documents we have not seen in a previous run
+    checksums = {}
+    if journal is not None:
+        journal.prune_remote(ids)
+        checksums = journal.remote_checksums()
+
+    def fetch(doc_id):
+        return doc_id, client.get_metadata(doc_id)
+
+    missing = ids - checksums.keys()
+    for doc_id, meta in bounded_map(fetch, missing, jobs):
+        checksums[doc_id] = meta["original_checksum"]
+        if journal is not None:
+            journal.add_remote(doc_id, meta["original_checksum"])
+
+    return checksums
+
+
+def get_remote_checksums(client, journal=None, jobs=1):
+    return set(get_remote_documents(client, journal=journal, jobs=jobs).values())
+
+
+def _matches(name, relpath, patterns):
+    return any(fnmatch(name, p) or fnmatch(relpath, p) for p in patterns)
+
+
+def _accepted(path, root, include, exclude, max_depth):
+    # the same filters as discover, for paths coming from somewhere else
+    relpath = os.path.relpath(path, root)
+    parts = relpath.split(os.sep)
+    if max_depth is not None and len(parts) - 1 > max_depth:
+        return False
+    for i in range(len(parts)):
+        if _matches(parts[i], os.sep.join(parts[: i + 1]), exclude):
+            return False
+    return not include or _matches(parts[-1], relpath, include)
+
+
+def discover(source, include=(), exclude=(), max_depth=None):
+    if os.path.isfile(source):
+        yield Path(source).resolve()
+        return
+
+    # resolve the root once, entries below it are already absolute
+    root = str(Path(source).resolve())
+    # join adds the separator unless root already ends with one, like "/"
+    prefix = len(os.path.join(root, ""))
+    stack = [(root, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logger.error("Cannot read %s: %s", directory, e)
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
 
-def get_document_types(url, token):
-    url = f"{url}/api/document_types/?page_size=100000"
+                relpath = entry.path[prefix:]
+                if _matches(entry.name, relpath, exclude):
+                    continue
 
-    r = requests.get(
-        url,
-        headers={"Authorization": f"Token {token}"},
-    )
+                if entry.is_dir(follow_symlinks=False):
+                    if max_depth is None or depth < max_depth:
+                        stack.append((entry.path, depth + 1))
+                    continue
 
-    r.raise_for_status()
+                if not entry.is_file():
+                    continue
 
-    data = r.json()
+                if include and not _matches(entry.name, relpath, include):
+                    continue
 
-    return {c["name"]: c["id"] for c in data["results"]}
+                if entry.is_symlink():
+                    yield Path(entry.path).resolve()
+                else:
+                    yield Path(entry.path)
 
 
-@click.command("ingest")
-@click.argument(
-    "source",
-    nargs=1,
-    type=click.Path(exists=True, readable=True, file_okay=True, dir_okay=True),
-)
-@click.option("--url", required=True)
-@click.option("--token", required=True)
-@click.option("--dry-run", "-s", is_flag=True)
-@click.option("--failed", type=Path)
-def main(source, dry_run, url, token, failed):
-    if failed is not None:
-        failed = failed.resolve()
+def with_finder_tags(items, batch_size=BATCH_SIZE):
+    # look up finder tags for a batch of files with a single `tag` call
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from _tag_batch(batch)
+            batch = []
+    if len(batch) > 0:
+        yield from _tag_batch(batch)
 
-    tags_seen = set()
-    tag_filterlist = set(
-        [
-            "Red",
-            "A",
-            "m",
-            "16-34-13",
-            "241B4924-D924-4FAF-8A5A-033910B7D5FD",
-            "2020-12-28",
-            "1",
-            "2019",
-            "v03",
-            "ESt",
-        ]
+
+def _tag_batch(batch):
+    try:
+        with metrics.phase("get_tags"):
+            finder_tags = get_tags_many([path for path, _ in batch])
+    except Exception as e:
+        # one bad file should not fail the others, they are looked up one by
+        # one in process() where errors end up with the file they belong to
+        logger.warning("Batch tag lookup failed, retrying per file: %s", e)
+        finder_tags = {}
+    for path, info in batch:
+        yield path, info, finder_tags.get(path)
+
+
+def file_tags(path, finder_tags, rules):
+    # filename and finder tags after the rules, with the correspondents and
+    # document types they select
+    try:
+        with metrics.phase("parse_filename"):
+            info = parse_filename(Path(path).name)
+    except RuntimeError:
+        info = FileInfo(dt=None, name=None, tags=set())
+
+    tags = set(finder_tags) | info.tags
+    tags = {tag.strip() for tag in tags if tag.strip() != ""}
+
+    return (info, *rules.apply(tags))
+
+
+def build_payload(
+    path, finder_tags, rules, correspondents, document_types, tag_id, created=None
+):
+    info, tags, matched_correspondents, matched_document_types = file_tags(
+        path, finder_tags, rules
     )
 
-    tag_map = {
-        "gewerbe": "Gewerbe",
-        "cern": "CERN",
-        "DOCT JGU": "DOCT",
-        "JGU DOCT": "DOCT",
-        "hetzner": "Hetzner",
-    }
+    data = []
 
-    correspondents = get_correspondents(url, token)
-    document_types = get_document_types(url, token)
-    tags_to_ids = get_all_tags(url, token)
-
-    tag_to_correspondent_map = {
-        "ing": "ING",
-        "ubs": "UBS",
-        "UBS": "UBS",
-        "mvb": "MVB",
-        "MVB": "MVB",
-        "DRV": "DRV",
-        "comdirect": "comdirect",
-        "JGU": "JGU Mainz",
-        "DPG": "DPG",
-        "edf": "EDF",
-        "Uniqa": "Uniqa",
-        "google": "Google",
-        "Hetzner": "Hetzner",
-        "apple": "Apple",
-        "axa": "AXA",
-        "union investment": "Union Investment",
-        "strato": "Strato",
-        "congstar": "congstar",
-        "tk": "TK",
-        "orange": "Orange",
-    }
+    for correspondent in matched_correspondents:
+        data.append(("correspondent", correspondents[correspondent]))
 
-    tag_to_document_type_map = {
-        "receipt": "Receipt",
-        "paper": "Paper",
-        "invoice": "Invoice",
-    }
+    for document_type in matched_document_types:
+        data.append(("document_type", document_types[document_type]))
 
-    for correspondent in tag_to_correspondent_map.values():
-        if correspondent not in correspondents:
-            if not dry_run:
-                correspondents[correspondent] = create_correspondent(
-                    url, token, correspondent
-                )
-            else:
-                correspondents[correspondent] = f"{correspondent} (NEW)"
-
-    for document_type in tag_to_document_type_map.values():
-        if document_type not in document_types:
-            if not dry_run:
-                document_types[document_type] = create_document_type(
-                    url, token, document_type
-                )
-            else:
-                document_types[document_type] = f"{document_type} (NEW)"
+    seen = set(tags)
 
-    try:
-        files = []
+    tags.add("ingest")
 
-        if os.path.isfile(source):
-            files.append(Path(source).resolve())
-        else:
-            for dirpath, _, filenames in os.walk(source):
-                for file in filenames:
-                    if file.startswith("."):
-                        continue
+    for tag in tags:
+        if tag.strip() == "":
+            continue
+        data.append(("tags", tag_id(tag)))
 
-                    path = (Path(dirpath) / file).resolve()
-                    files.append(path)
+    if info.name is not None:
+        name, _ = os.path.splitext(info.name)
+        data.append(("title", name))
 
-        for path in files:
-            tags = get_tags(path)
-            try:
-                info = parse_filename(path.name)
-            except RuntimeError:
-                info = dataclass(dt=None, name=None, tags=set())
+    # the name wins over the date in the pdf, the file time is a last resort
+    date = info.dt or created
+    if date is None:
+        stat = os.stat(path)
+        #  print("date from stat", stat)
+        date = datetime.fromtimestamp(stat.st_mtime)
 
-            data = []
+    date = date.date()
 
-            tags |= info.tags
-            tags = {tag.strip() for tag in tags if tag.strip() != ""}
+    data.append(("created", str(date)))
 
-            tags = {tag_map.get(tag, tag) for tag in tags}
+    return data, tags, seen
 
-            for tag, correspondent in tag_to_correspondent_map.items():
-                if tag in tags:
-                    data.append(("correspondent", correspondents[correspondent]))
-                    tags.remove(tag)
 
-            for tag, document_type in tag_to_document_type_map.items():
-                if tag in tags:
-                    data.append(("document_type", document_types[document_type]))
-                    tags.remove(tag)
+# fields of a rejected upload that point at stale tag, correspondent or
+# document type ids
+STALE_FIELDS = {
+    "tags": "tags",
+    "correspondent": "correspondents",
+    "document_type": "document_types",
+}
 
-            tags -= tag_filterlist
 
-            tags_seen |= tags
+def upload(client, path, data, chunk_size=CHUNK_SIZE):
+    with metrics.phase("upload"), MultipartStream(
+        data, "document", path, chunk_size=chunk_size
+    ) as body:
+        r = client.post(
+            "/api/documents/post_document/",
+            data=body,
+            headers={"Content-Type": body.content_type},
+        )
+    # the file may be gone by now (--watch, another tool sorting it away),
+    # so its size is the one measured for the upload
+    size = body.size
 
-            tags.add("ingest")
+    try:
+        r.raise_for_status()
+    except requests.exceptions.HTTPError:
+        try:
+            errors = r.json()
+        except ValueError:
+            return None, [r.text], [], size
+
+        stale = []
+        if r.status_code == 400 and isinstance(errors, dict):
+            stale = [v for k, v in STALE_FIELDS.items() if k in errors]
+        try:
+            return None, errors["document"], stale, size
+        except (KeyError, TypeError):
+            return None, [r.text], stale, size
+
+    return r.json(), None, [], size
+
+
+def link_failed(path, failed):
+    Path(failed).mkdir(exist_ok=True, parents=True)
+    dest = failed / Path(path).name
+    print(dest, " exists?", dest.exists())
+    if not dest.exists() and not dest.is_symlink():
+        try:
+            os.symlink(path, dest)
+        except FileExistsError:
+            # another worker linked a file with the same name
+            pass
 
-            print(path)
-            print(tags)
 
-            for tag in tags:
-                if tag.strip() == "":
-                    continue
-                if dry_run:
-                    data.append(("tags", f"{tag} (NEW)"))
-                else:
-                    if tag == "":
-                        continue
-                    if not tag in tags_to_ids:
-                        tags_to_ids[tag] = create_tag(url, token, tag)
-                    data.append(("tags", tags_to_ids[tag]))
-
-            if info.name is not None:
-                name, _ = os.path.splitext(info.name)
-                data.append(("title", name))
-
-            date = info.dt
-            if date is None:
-                stat = os.stat(path)
-                #  print("date from stat", stat)
-                date = datetime.fromtimestamp(stat.st_mtime)
+@click.command("ingest")
+@click.argument(
+    "source",
+    nargs=1,
+    type=click.Path(exists=True, readable=True, file_okay=True, dir_okay=True),
+)
+@click.option("--url", required=True)
+@click.option("--token", required=True)
+@click.option("--dry-run", "-s", is_flag=True)
+@click.option("--failed", type=Path)
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1)
+@click.option(
+    "--state",
+    type=Path,
+    help="SQLite journal of uploaded files, re-runs skip files recorded there",
+)
+@click.option(
+    "--dedup",
+    is_flag=True,
+    help="Skip files whose checksum is already known to the server, the "
+    "checksums are kept in --state or else in the cache directory",
+)
+@click.option("--rate", type=float, help="Maximum API requests per second")
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(min=0),
+    default=3600,
+    help="Seconds to reuse cached tags, correspondents and document types, 0 disables",
+)
+@click.option("--refresh-cache", is_flag=True)
+@click.option(
+    "--include", multiple=True, help="Only ingest files matching this glob pattern"
+)
+@click.option("--exclude", multiple=True, help="Skip files and directories matching")
+@click.option(
+    "--max-depth",
+    type=click.IntRange(min=0),
+    help="How many directory levels below source to descend",
+)
+@click.option(
+    "--watch",
+    "watch_source",
+    is_flag=True,
+    help="Keep running and ingest files as they arrive below source",
+)
+@click.option(
+    "--settle",
+    default=2.0,
+    help="Seconds a file has to stay unchanged before it is picked up",
+)
+@click.option("--polling", is_flag=True, help="Poll instead of using inotify")
+@click.option(
+    "--rules",
+    "rules_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=DEFAULT_RULES,
+    show_default=True,
+    help="TOML or YAML file mapping tags to correspondents and document types",
+)
+@click.option(
+    "--upload-buffer",
+    type=click.IntRange(min=1),
+    default=CHUNK_SIZE // 1024,
+    show_default=True,
+    help="KiB of file contents each upload worker holds in memory",
+)
+@click.option(
+    "--task-timeout",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Seconds to wait at the end for paperless to consume the uploads, "
+    "tasks that finish earlier are reported either way",
+)
+@click.option("--timings", is_flag=True, help="Print per phase and endpoint timings")
+@click.option(
+    "--metrics-file",
+    type=Path,
+    help="Write timings as json (*.json) or a prometheus textfile",
+)
+def main(
+    source,
+    dry_run,
+    url,
+    token,
+    failed,
+    jobs,
+    state,
+    dedup,
+    rate,
+    cache_ttl,
+    refresh_cache,
+    include,
+    exclude,
+    max_depth,
+    watch_source,
+    settle,
+    polling,
+    rules_file,
+    upload_buffer,
+    task_timeout,
+    timings,
+    metrics_file,
+):
+    if timings or metrics_file is not None:
+        metrics.enable()
+
+    if failed is not None:
+        failed = failed.resolve()
 
-            date = date.date()
+    rules = Rules.load(rules_file)
 
-            data.append(("created", str(date)))
+    cache = MetadataCache(url, ttl=cache_ttl) if cache_ttl > 0 else None
+    if cache is not None and refresh_cache:
+        cache.invalidate()
+    client = PaperlessClient(url, token, max_connections=jobs, rate=rate, cache=cache)
+    journal = Journal(state) if state is not None and not dry_run else None
 
-            #  print("-", path)
-            #  print("  name:", info.name)
-            #  print("  tags:", tags)
-            #  print("  date:", date)
-            #  print("  info:", info)
+    tags_seen = set()
 
-            full_url = f"{url}/api/documents/post_document/"
+    def load_correspondents(refresh=False):
+        return load_name_map(
+            client,
+            get_correspondents,
+            create_correspondent,
+            rules.correspondents,
+            dry_run,
+            refresh=refresh,
+        )
+
+    def load_document_types(refresh=False):
+        return load_name_map(
+            client,
+            get_document_types,
+            create_document_type,
+            rules.document_types,
+            dry_run,
+            refresh=refresh,
+        )
+
+    correspondents = load_correspondents()
+    document_types = load_document_types()
+    tags_to_ids = get_all_tags(client)
+
+    refresh_lock = threading.Lock()
+
+    def refresh_maps(endpoints):
+        # the server rejected ids from our maps, the cache was out of date
+        with refresh_lock:
+            if "tags" in endpoints:
+                with _tag_lock:
+                    replace_items(tags_to_ids, get_all_tags(client, refresh=True))
+            if "correspondents" in endpoints:
+                replace_items(correspondents, load_correspondents(refresh=True))
+            if "document_types" in endpoints:
+                replace_items(document_types, load_document_types(refresh=True))
+
+    remote_checksums = set()
+    if dedup:
+        if journal is not None:
+            remote_checksums = get_remote_checksums(client, journal=journal, jobs=jobs)
+        else:
+            # the metadata of every document is only fetched once per server
+            with Journal(remote_state_path(url)) as remote:
+                remote_checksums = get_remote_checksums(
+                    client, journal=remote, jobs=jobs
+                )
+        print("Server has", len(remote_checksums), "documents")
 
-            print(data)
+    if dry_run:
+        tag_id = lambda tag: f"{tag} (NEW)"
+    else:
+        tag_id = lambda tag: ensure_tag(client, tag, tags_to_ids)
+
+    def consumed(path, task):
+        if task["status"] == "SUCCESS":
+            print("Consumed:", path, "as document", task.get("related_document"))
+            if journal is not None:
+                journal.set_status(path, "uploaded")
+            return
+
+        error = task.get("result") or task["status"]
+        # paperless refuses duplicates after the upload already went through
+        status = "duplicate" if "duplicate" in error.lower() else "failed"
+        print("Consumption failed:", path)
+        print(error)
+        if journal is not None:
+            journal.set_status(path, status, error=error)
+        if status == "failed" and failed is not None:
+            link_failed(path, failed)
+
+    tracker = None
+    if not dry_run:
+        tracker = TaskTracker(client, consumed)
+        if journal is not None:
+            # uploads from earlier runs that were still waiting to be consumed
+            for path, task_id in journal.unconfirmed():
+                tracker.add(task_id, path)
+
+    def process(item):
+        path, info, finder_tags = item
+        checksum = info.checksum
+        result = dataclass(
+            path=path,
+            pages=info.pages,
+            size=0,
+            seconds=0.0,
+            tags=set(),
+            seen=set(),
+            data=[],
+            error=None,
+            skipped=None,
+        )
+        if info.error is not None:
+            result.error = [info.error]
+            return result
+
+        try:
+            if finder_tags is None:
+                with metrics.phase("get_tags"):
+                    finder_tags = get_tags(path)
+
+            if checksum in remote_checksums:
+                if journal is not None:
+                    journal.record(path, os.stat(path), checksum, "duplicate")
+                result.skipped = "duplicate on server"
+                return result
+
+            if journal is not None:
+                stat = os.stat(path)
+                existing = journal.reserve(path, stat, checksum)
+                if existing is not None:
+                    other, status, task_id = existing
+                    if status == "uploading":
+                        # another worker has the same content in flight, the
+                        # next run records this file once that upload is done
+                        result.skipped = f"same content is being uploaded as {other}"
+                        return result
+                    # same content was uploaded before, from another path
+                    journal.record(path, stat, checksum, "uploaded", task_id)
+                    result.skipped = f"already uploaded as {other}"
+                    return result
+
+            for attempt in range(2):
+                result.data, result.tags, result.seen = build_payload(
+                    path,
+                    finder_tags,
+                    rules,
+                    correspondents,
+                    document_types,
+                    tag_id,
+                    created=info.created,
+                )
+                if dry_run:
+                    return result
 
-            if not dry_run:
-                with open(path, "rb") as fh:
-                    r = requests.post(
-                        full_url,
-                        headers={"Authorization": f"Token {token}"},
-                        files={"document": fh},
-                        data=data,
+                start = time.perf_counter()
+                task_id, result.error, stale, result.size = upload(
+                    client, path, result.data, chunk_size=upload_buffer * 1024
+                )
+                result.seconds = time.perf_counter() - start
+                if len(stale) == 0 or attempt > 0:
+                    break
+                # only our cached ids were wrong, try once more with fresh ones
+                logger.warning("Refreshing %s after a rejected upload", stale)
+                refresh_maps(stale)
+
+            if journal is not None:
+                if result.error is None:
+                    journal.record(path, stat, checksum, "unconfirmed", task_id)
+                else:
+                    journal.record(
+                        path, stat, checksum, "failed", error=" ".join(result.error)
                     )
-                    result = r.json()
-                    try:
-                        r.raise_for_status()
-                    except requests.exceptions.HTTPError:
-                        print("Failed:", path)
-                        print(*r.json()["document"])
-                        if failed is not None:
-                            Path(failed).mkdir(exist_ok=True, parents=True)
-                            dest = failed / Path(path).name
-                            print(dest, " exists?", dest.exists())
-                            if not dest.exists() and not dest.is_symlink():
-                                subprocess.check_call(["ln", "-s", path, str(dest)])
-                        continue
-
-                    pass
+
+            if tracker is not None and result.error is None:
+                tracker.add(task_id, path)
+        except Exception as e:
+            logger.error("Failed to ingest %s", path, exc_info=True)
+            result.error = [str(e)]
+            if journal is not None:
+                # releases a reservation this file might hold
+                journal.set_status(path, "failed", error=str(e))
+        return result
+
+    uploaded = dataclass(files=0, bytes=0, start=time.perf_counter())
+
+    def run(files, executor=None):
+        nonlocal tags_seen
+
+        if journal is not None:
+            files = (path for path in files if not journal.is_done(path))
+
+        # checksums, page counts and pdf dates are worked out on all cores
+        # ahead of the uploads
+        items = (
+            (
+                path,
+                dataclass(checksum=checksum, pages=pages, created=created, error=error),
+            )
+            for path, checksum, pages, created, error in inspect_many(
+                files, executor=executor
+            )
+        )
+        items = with_finder_tags(items)
+
+        for result in bounded_map(process, items, jobs):
+            if result.skipped is not None:
+                print("Skipping", result.path, result.skipped)
+                continue
+
+            tags_seen |= result.seen
+
+            print(result.path, f"({result.pages} pages)" if result.pages else "")
+            print(result.tags)
+            print(result.data)
+
+            if result.error is not None:
+                print("Failed:", result.path)
+                print(*result.error)
+                if failed is not None:
+                    link_failed(result.path, failed)
+                continue
+
+            if result.seconds > 0:
+                uploaded.files += 1
+                uploaded.bytes += result.size
+                print(
+                    f"Uploaded {result.size / 2**20:.1f} MiB in {result.seconds:.1f}s "
+                    f"({result.size / 2**20 / result.seconds:.1f} MiB/s)"
+                )
+
             print()
 
+    try:
+        if watch_source:
+            root = str(Path(source).resolve())
+            logger.info("Watching %s", root)
+            # larger batches share one set of worker processes
+            with process_pool(os.cpu_count() or 1) as executor:
+                for batch in watch(root, settle=settle, polling=polling):
+                    batch = [
+                        Path(path)
+                        for path in batch
+                        if _accepted(path, root, include, exclude, max_depth)
+                    ]
+                    try:
+                        run(batch, executor=executor)
+                    except Exception as e:
+                        logger.error("Caught exception: %s" % str(e), exc_info=True)
+        else:
+            files = discover(
+                source, include=include, exclude=exclude, max_depth=max_depth
+            )
+            run(metrics.timed("discovery", files))
+
+        if tracker is not None:
+            if task_timeout > 0 and len(tracker) > 0:
+                print("Waiting for paperless to consume", len(tracker), "documents")
+            for path in tracker.close(timeout=task_timeout):
+                print("Not consumed yet:", path)
+            if journal is not None and len(journal.unconfirmed()) > 0:
+                print("Unconfirmed uploads are checked again on the next run")
+
         print("All tags seen:", tags_seen)
+        if uploaded.files > 0:
+            elapsed = time.perf_counter() - uploaded.start
+            print(
+                f"Uploaded {uploaded.files} files, {uploaded.bytes / 2**20:.1f} MiB "
+                f"at {uploaded.bytes / 2**20 / elapsed:.1f} MiB/s"
+            )
+        print("API:", client.summary())
 
     except Exception as e:
         logger.error("Caught exception: %s" % str(e), exc_info=True)
+    finally:
+        if tracker is not None and not tracker.closed:
+            # after an error, its callbacks must not outlive the journal
+            tracker.close(timeout=0)
+        if journal is not None:
+            journal.close()
+        if timings:
+            print(metrics.summary())
+        if metrics_file is not None:
+            metrics.export(metrics_file)
 
 
 if __name__ == "__main__":
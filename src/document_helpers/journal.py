@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+def _connect(path):
+    db = sqlite3.connect(str(path), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        # shared between the upload workers, all access goes through the lock
+        self.lock = threading.Lock()
+        self.db = _connect(path)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                checksum TEXT,
+                status TEXT NOT NULL,
+                task_id TEXT,
+                error TEXT,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS remote_documents (
+                id INTEGER PRIMARY KEY,
+                checksum TEXT NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_checksum ON files (checksum)")
+        # claims left behind by a run that was killed mid-upload
+        self.db.execute("DELETE FROM files WHERE status = 'uploading'")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def lookup(self, path):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns, checksum, status, task_id FROM files WHERE path = ?",
+                (str(path),),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["size", "mtime_ns", "checksum", "status", "task_id"], row))
+
+    def is_done(self, path, stat=None):
+        entry = self.lookup(path)
+        # unconfirmed uploads are not sent again, their consume tasks are
+        # looked up instead
+        if entry is None or entry["status"] not in (
+            "uploaded",
+            "unconfirmed",
+            "duplicate",
+        ):
+            return False
+        stat = stat or os.stat(path)
+        # only trust the entry while the file is unchanged
+        return entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+    def find_uploaded(self, checksum):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path, task_id FROM files WHERE checksum = ? AND status = 'uploaded'",
+                (checksum,),
+            ).fetchone()
+        return row
+
+    def reserve(self, path, stat, checksum):
+        # claims the checksum for path before it is uploaded, so concurrent
+        # workers holding the same content do not all upload it. Returns the
+        # (path, status, task_id) of an earlier claim instead, if there is one.
+        with self.lock:
+            row = self.db.execute(
+                """
+                SELECT path, status, task_id FROM files
+                WHERE checksum = ?
+                AND status IN ('uploaded', 'unconfirmed', 'uploading')
+                AND path != ?
+                """,
+                (checksum, str(path)),
+            ).fetchone()
+            if row is not None:
+                return row
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO files
+                (path, size, mtime_ns, checksum, status, updated)
+                VALUES (?, ?, ?, ?, 'uploading', ?)
+                """,
+                (str(path), stat.st_size, stat.st_mtime_ns, checksum, time.time()),
+            )
+            self.db.commit()
+        return None
+
+    def unconfirmed(self):
+        # uploads whose consume task had not finished when a run ended
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT path, task_id FROM files WHERE status = 'unconfirmed'"
+            )
+            return rows.fetchall()
+
+    def record(self, path, stat, checksum, status, task_id=None, error=None):
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO files
+                (path, size, mtime_ns, checksum, status, task_id, error, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    str(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    checksum,
+                    status,
+                    task_id,
+                    error,
+                    time.time(),
+                ),
+            )
+            self.db.commit()
+
+    def set_status(self, path, status, error=None):
+        with self.lock:
+            self.db.execute(
+                "UPDATE files SET status = ?, error = ?, updated = ? WHERE path = ?",
+                (status, error, time.time(), str(path)),
+            )
+            self.db.commit()
+
+    def remote_checksums(self):
+        with self.lock:
+            rows = self.db.execute("SELECT id, checksum FROM remote_documents")
+            return dict(rows.fetchall())
+
+    def add_remote(self, doc_id, checksum):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO remote_documents (id, checksum) VALUES (?, ?)",
+                (doc_id, checksum),
+            )
+            self.db.commit()
+
+    def prune_remote(self, ids):
+        # forget documents that were deleted on the server
+        with self.lock:
+            known = [
+                row[0] for row in self.db.execute("SELECT id FROM remote_documents")
+            ]
+            gone = [(doc_id,) for doc_id in known if doc_id not in ids]
+            self.db.executemany("DELETE FROM remote_documents WHERE id = ?", gone)
+            self.db.commit()
+
+
+class CheckState:
+    def __init__(self, path, sweep_days=7):
+        self.path = path
+        self.sweep_days = sweep_days
+        self.lock = threading.Lock()
+        self.db = _connect(path)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                modified TEXT,
+                checksum TEXT,
+                ok INTEGER NOT NULL,
+                verified REAL NOT NULL
+            )
+            """
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entries(self):
+        with self.lock:
+            rows = self.db.execute("SELECT id, modified, ok, verified FROM documents")
+            return {row[0]: row[1:] for row in rows}
+
+    def select(self, docs, now=None):
+        # changed, new and broken documents are always checked, everything
+        # else once per sweep period, spread over the days by id
+        now = now or time.time()
+        day = int(now // 86400)
+        entries = self.entries()
+
+        for doc in docs:
+            entry = entries.get(doc["id"])
+            if entry is None:
+                yield doc
+                continue
+
+            modified, ok, verified = entry
+            if modified != doc.get("modified") or not ok:
+                yield doc
+            elif now - verified >= self.sweep_days * 86400:
+                yield doc
+            elif doc["id"] % self.sweep_days == day % self.sweep_days:
+                if int(verified // 86400) < day:
+                    yield doc
+
+    def record(self, doc_id, modified, ok, checksum=None):
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO documents (id, modified, checksum, ok, verified)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (doc_id, modified, checksum, int(ok), time.time()),
+            )
+            self.db.commit()
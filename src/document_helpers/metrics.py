@@ -0,0 +1,217 @@
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+# upper bounds in seconds, roughly what prometheus clients use by default
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(path):
+    # /api/documents/123/download/?x=1 -> /api/documents/{id}/download/
+    return _ID_RE.sub("/{id}", urlsplit(path).path)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # upper bound of the bucket the quantile falls into
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(
+                zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)
+            ),
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    # everything is a no-op until enable() is called
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.requests = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+            self.requests = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name, iterable):
+        # time spent producing the items of an iterable
+        if not self.enabled:
+            return iterable
+        return self._timed(name, iterable)
+
+    def _timed(self, name, iterable):
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.observe(name, time.perf_counter() - start)
+                return
+            self.observe(name, time.perf_counter() - start)
+            yield item
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.phases.get(name)
+            if histogram is None:
+                histogram = self.phases[name] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_request(self, method, path, seconds):
+        if not self.enabled:
+            return
+        key = (method, endpoint_of(path))
+        with self.lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def summary(self):
+        lines = []
+        rows = [("phase", name, h) for name, h in sorted(self.phases.items())]
+        rows += [
+            ("http", f"{method} {endpoint}", h)
+            for (method, endpoint), h in sorted(self.requests.items())
+        ]
+        if len(rows) == 0:
+            return "No timings recorded"
+
+        width = max(len(label) for _, label, _ in rows)
+        lines.append(
+            f"{'':5} {'':{width}} {'count':>7} {'total':>9} "
+            f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        )
+        for kind, label, h in rows:
+            ms = [h.quantile(q) * 1000 for q in (0.5, 0.9, 0.99)]
+            lines.append(
+                f"{kind:5} {label:{width}} {h.count:>7} {h.sum:>8.2f}s "
+                f"{ms[0]:>6.1f}ms {ms[1]:>6.1f}ms {ms[2]:>6.1f}ms "
+                f"{h.max * 1000:>6.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {
+            "phases": {name: h.as_dict() for name, h in self.phases.items()},
+            "requests": [
+                {"method": method, "endpoint": endpoint, **h.as_dict()}
+                for (method, endpoint), h in self.requests.items()
+            ],
+        }
+
+    def prometheus(self, prefix="document_helpers"):
+        lines = []
+
+        def histogram(name, labels, h):
+            cumulative = 0
+            for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+            lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        name = f"{prefix}_phase_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for phase, h in sorted(self.phases.items()):
+            histogram(name, f'phase="{phase}"', h)
+
+        name = f"{prefix}_http_request_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for (method, endpoint), h in sorted(self.requests.items()):
+            histogram(name, f'method="{method}",endpoint="{endpoint}"', h)
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # json for *.json, otherwise a node_exporter textfile
+        path = str(path)
+        if path.endswith(".json"):
+            content = json.dumps(self.as_dict(), indent=2)
+        else:
+            content = self.prometheus()
+
+        # the textfile collector may read at any time, so replace atomically
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fh:
+            fh.write(content)
+        os.replace(tmp, path)
+
+
+metrics = Metrics()
@@ -0,0 +1,85 @@
+import mimetypes
+import os
+import uuid
+
+# file contents held in memory per upload
+CHUNK_SIZE = 1024 * 1024
+
+_QUOTE = {ord('"'): "%22", ord("\r"): "%0D", ord("\n"): "%0A"}
+
+
+def _disposition(name, filename=None):
+    header = f'Content-Disposition: form-data; name="{name.translate(_QUOTE)}"'
+    if filename is not None:
+        header += f'; filename="{filename.translate(_QUOTE)}"'
+    return header
+
+
+class MultipartStream:
+    # a multipart/form-data body that is read from disk while it is sent,
+    # requests would otherwise build the whole body in memory. It has a
+    # length, so the request still goes out with a Content-Length header.
+    def __init__(self, fields, name, path, chunk_size=CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+
+        head = []
+        for key, value in fields:
+            head.append(f"--{self.boundary}\r\n{_disposition(key)}\r\n\r\n{value}\r\n")
+        file_type = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+        head.append(
+            f"--{self.boundary}\r\n{_disposition(name, os.path.basename(path))}\r\n"
+            f"Content-Type: {file_type}\r\n\r\n"
+        )
+        self.head = "".join(head).encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+        self.fh = open(path, "rb")
+        self.size = os.fstat(self.fh.fileno()).st_size
+        self.length = len(self.head) + self.size + len(self.tail)
+
+        self.sent = 0
+        self.buffer = b""
+        self.offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.fh.close()
+
+    def _next_chunk(self):
+        if self.sent < len(self.head):
+            return self.head
+        remaining = len(self.head) + self.size - self.sent
+        if remaining > 0:
+            chunk = self.fh.read(min(self.chunk_size, remaining))
+            if len(chunk) == 0:
+                # we promised the server a length we can no longer deliver
+                raise OSError(f"{self.fh.name} shrank during the upload")
+            return chunk
+        if self.sent == len(self.head) + self.size and self.fh.read(1) != b"":
+            # a scanner still writing, what we sent is not the whole file
+            raise OSError(f"{self.fh.name} grew during the upload")
+        return self.tail if self.sent < self.length else b""
+
+    def read(self, size=-1):
+        if self.offset >= len(self.buffer):
+            self.buffer = self._next_chunk()
+            self.offset = 0
+            if len(self.buffer) == 0:
+                return b""
+
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = self.buffer[self.offset : self.offset + size]
+        self.offset += len(data)
+        self.sent += len(data)
+        return data
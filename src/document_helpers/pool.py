@@ -0,0 +1,92 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    wait,
+)
+
+
+def bounded_map(fn, items, jobs, executor_class=ThreadPoolExecutor, executor=None):
+    # runs on executor if one is given, it is left running afterwards
+    if jobs <= 1:
+        yield from map(fn, items)
+        return
+
+    if executor is not None:
+        yield from _bounded_submit(executor, fn, items, jobs)
+        return
+
+    with executor_class(max_workers=jobs) as executor:
+        yield from _bounded_submit(executor, fn, items, jobs)
+
+
+def _bounded_submit(executor, fn, items, jobs):
+    # keep only a couple of items per worker in flight, so a huge tree does
+    # not end up as a huge list of futures
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= 2 * jobs:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    for future in pending:
+        yield future.result()
+
+
+def process_pool(max_workers):
+    # forking a process that already runs threads can leave locks held in the
+    # children, so the workers start from a fresh interpreter
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+_DONE = object()
+
+
+def prefetch(items, size):
+    # pull items on a background thread into a bounded queue, so the producer
+    # keeps working while the consumer is busy, but never runs too far ahead
+    q = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fill():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    break
+            else:
+                put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    thread = threading.Thread(target=fill, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # the consumer stopped early, let the thread finish
+        stop.set()
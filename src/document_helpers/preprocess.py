@@ -0,0 +1,103 @@
+import hashlib
+import itertools
+import mmap
+import os
+import re
+from datetime import datetime
+
+from .pool import bounded_map, prefetch, process_pool
+
+# finished files waiting for the upload stage
+QUEUE_SIZE = 64
+
+# batches up to this size are inspected in this process, starting the worker
+# processes takes longer than hashing a few files
+INLINE_FILES = 4
+
+# a single pass over the file picks up page objects, page tree counts and
+# the creation date from the info dictionary or the XMP packet
+PDF_RE = re.compile(
+    rb"/Type\s*/Page(?P<tree>s)?\b"
+    rb"|/Count\s+(?P<count>\d+)"
+    rb"|/CreationDate\s*\(D:(?P<info>\d{4}(?:\d{2}){0,2})"
+    rb"|xmp:CreateDate(?:>|=[\"'])(?P<xmp>\d{4}(?:-\d{2}){0,2})"
+)
+
+
+def _date(digits):
+    digits = digits.replace(b"-", b"")
+    try:
+        return datetime(int(digits[0:4]), int(digits[4:6] or 1), int(digits[6:8] or 1))
+    except ValueError:
+        return None
+
+
+def scan_pdf(buf):
+    # works on the raw bytes, so page objects inside compressed object
+    # streams are not seen, the largest page tree /Count covers most of those
+    pages = 0
+    count = 0
+    info_date = None
+    xmp_date = None
+    for m in PDF_RE.finditer(buf):
+        if m.group("count") is not None:
+            count = max(count, int(m.group("count")))
+        elif m.group("info") is not None:
+            info_date = info_date or _date(m.group("info"))
+        elif m.group("xmp") is not None:
+            xmp_date = xmp_date or _date(m.group("xmp"))
+        elif m.group("tree") is None:
+            pages += 1
+
+    return pages or count or None, info_date or xmp_date
+
+
+def inspect_file(path):
+    # returns (path, checksum, pages, created, error), a file that vanished or
+    # cannot be read only fails itself
+    try:
+        return (path, *_inspect(path), None)
+    except OSError as e:
+        return path, None, None, None, str(e)
+
+
+def _inspect(path):
+    # mmap instead of read(), the kernel pages the file in and out as needed
+    # and nothing is copied into python bytes objects
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return hashlib.md5().hexdigest(), None, None
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            checksum = hashlib.md5(mm).hexdigest()
+
+            pages, created = None, None
+            if mm.find(b"%PDF-", 0, 1024) != -1:
+                pages, created = scan_pdf(mm)
+
+    return checksum, pages, created
+
+
+def inspect_many(paths, jobs=None, queue_size=QUEUE_SIZE, executor=None):
+    # hashing and scanning is CPU bound, so it runs on all cores while the
+    # upload stage works through the queue. executor is a process pool that
+    # outlives the call, --watch hands the same one to every batch
+    jobs = jobs or os.cpu_count() or 1
+    paths = iter(paths)
+    # look far enough ahead to know small batches, and batches smaller than
+    # the pool, by their size
+    head = list(itertools.islice(paths, max(jobs, INLINE_FILES + 1)))
+    if len(head) <= INLINE_FILES:
+        return prefetch(map(inspect_file, head), queue_size)
+
+    results = bounded_map(
+        inspect_file,
+        itertools.chain(head, paths),
+        min(jobs, len(head)),
+        executor_class=process_pool,
+        executor=executor,
+    )
+    return prefetch(results, queue_size)
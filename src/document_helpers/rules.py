@@ -0,0 +1,148 @@
+import re
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+DEFAULT_RULES = Path(__file__).parent / "rules.toml"
+
+IGNORE = "ignore"
+TAG = "tag"
+CORRESPONDENT = "correspondent"
+DOCUMENT_TYPE = "document_type"
+
+_KINDS = (IGNORE, TAG, CORRESPONDENT, DOCUMENT_TYPE)
+
+
+def read_rules(path):
+    path = Path(path)
+    if path.suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuntimeError("Reading yaml rules needs PyYAML")
+        with open(path) as fh:
+            return yaml.safe_load(fh) or {}
+
+    if tomllib is None:
+        raise RuntimeError("Reading toml rules needs python 3.11 or tomli")
+    with open(path, "rb") as fh:
+        return tomllib.load(fh)
+
+
+class Rules:
+    # every rule is compiled into one dict keyed by the (folded) tag, and all
+    # patterns into a single alternation, so a file costs O(tags) lookups
+    # no matter how many rules there are
+    def __init__(
+        self,
+        ignore=(),
+        aliases=None,
+        correspondents=None,
+        document_types=None,
+        patterns=(),
+        case_sensitive=False,
+    ):
+        self.case_sensitive = case_sensitive
+        self.aliases = {self.fold(k): v for k, v in (aliases or {}).items()}
+        self.index = {}
+        self.correspondents = set()
+        self.document_types = set()
+
+        for tag in ignore:
+            self._add(tag, IGNORE, None)
+        for name, tags in (correspondents or {}).items():
+            self.correspondents.add(name)
+            for tag in tags:
+                self._add(tag, CORRESPONDENT, name)
+        for name, tags in (document_types or {}).items():
+            self.document_types.add(name)
+            for tag in tags:
+                self._add(tag, DOCUMENT_TYPE, name)
+
+        self.actions = []
+        groups = []
+        for i, rule in enumerate(patterns):
+            kinds = [kind for kind in _KINDS if kind in rule]
+            if len(kinds) != 1 or "match" not in rule:
+                raise ValueError(f"Invalid pattern rule: {rule}")
+            kind = kinds[0]
+            value = None if kind == IGNORE else rule[kind]
+            if kind == CORRESPONDENT:
+                self.correspondents.add(value)
+            elif kind == DOCUMENT_TYPE:
+                self.document_types.add(value)
+            self.actions.append((kind, value))
+            groups.append(f"(?P<r{i}>{rule['match']})")
+
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.pattern = re.compile("|".join(groups), flags) if groups else None
+
+        # tag -> (kind, value), filled as tags are seen
+        self.resolved = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES):
+        data = read_rules(path)
+        return cls(
+            ignore=data.get("ignore", ()),
+            aliases=data.get("aliases"),
+            correspondents=data.get("correspondents"),
+            document_types=data.get("document_types"),
+            patterns=data.get("patterns", ()),
+            case_sensitive=data.get("case_sensitive", False),
+        )
+
+    def fold(self, tag):
+        return tag if self.case_sensitive else tag.casefold()
+
+    def _add(self, tag, kind, value):
+        key = self.fold(tag)
+        existing = self.index.get(key)
+        if existing is not None and existing != (kind, value):
+            raise ValueError(f"Conflicting rules for tag {tag!r}")
+        self.index[key] = (kind, value)
+
+    def resolve(self, tag):
+        result = self.resolved.get(tag)
+        if result is None:
+            result = self.resolved[tag] = self._resolve(tag)
+        return result
+
+    def _resolve(self, tag):
+        tag = self.aliases.get(self.fold(tag), tag)
+
+        action = self.index.get(self.fold(tag))
+        if action is not None:
+            return action
+
+        if self.pattern is not None:
+            m = self.pattern.fullmatch(tag)
+            if m is not None:
+                return self.actions[int(m.lastgroup[1:])]
+
+        return TAG, tag
+
+    def apply(self, tags):
+        # returns the remaining tags, and the correspondents and document
+        # types selected by the others
+        result = set()
+        correspondents = set()
+        document_types = set()
+        for tag in tags:
+            kind, value = self.resolve(tag)
+            if kind == TAG:
+                result.add(value)
+            elif kind == CORRESPONDENT:
+                correspondents.add(value)
+            elif kind == DOCUMENT_TYPE:
+                document_types.add(value)
+        return result, sorted(correspondents), sorted(document_types)
@@ -14,8 +14,10 @@ import logging
 import click
 
 from .log import get_logger
-from .filename import parse_filename, format_filename
-from .tags import get_tags, set_tags
+from .filename import dataclass, parse_filename, format_filename
+from .pool import bounded_map
+from .tags import get_tags, get_tags_many, set_tags_many
+from .watch import watch
 
 print("SCRIPT")
 
@@ -35,7 +37,7 @@ level = logging.DEBUG
 logger = get_logger("sort", level)
 
 
-def move(f, basedir, dr, tags_exe):
+def plan_move(f, basedir, tags_exe, finder_tags=None):
     if not os.path.exists(f):
         logger.error("%s not found", f)
         return
@@ -53,25 +55,81 @@ def move(f, basedir, dr, tags_exe):
         year = mtime.year
         name_info.dt = mtime
 
-    root, ext = os.path.splitext(os.path.basename(f))
-
     destdir = os.path.join(basedir, str(year), "{:02d}".format(month))
-    if not dr:
-        os.system('mkdir -p "{}"'.format(destdir))
 
     # fname = "{}-{}".format(mtime.strftime("%Y-%m-%d"), root)
     # dest = os.path.join(destdir, fname + ext)
-    tags = get_tags(f, tags_exe=tags_exe) | name_info.tags
+    if finder_tags is None:
+        finder_tags = get_tags(f, tags_exe=tags_exe)
+    tags = finder_tags | name_info.tags
     dest = os.path.join(
         destdir, format_filename(name_info.name, name_info.dt, tags=tags)
     )
 
     logger.info("=> %s", dest)
     logger.debug("Setting finder tags to: %s", ", ".join(tags))
-    if not dr:
-        cmd = "mv {} {}".format(quote(f), quote(dest))
-        os.system(cmd)
-        set_tags(dest, tags, tags_exe=tags_exe)
+
+    return dataclass(src=f, destdir=destdir, dest=dest, tags=tags)
+
+
+def plan_moves(files, basedir, tags_exe):
+    # read all finder tags up front, and write them back in one go later
+    finder_tags = get_tags_many([f for f in files if os.path.exists(f)], tags_exe)
+
+    plans = []
+    targets = {}
+    for f in files:
+        plan = plan_move(f, basedir, tags_exe, finder_tags=finder_tags.get(f))
+        if plan is None:
+            continue
+
+        if plan.dest in targets:
+            logger.error(
+                "%s and %s would both be moved to %s, skipping the former",
+                f,
+                targets[plan.dest],
+                plan.dest,
+            )
+            continue
+
+        if os.path.exists(plan.dest) and not os.path.samefile(f, plan.dest):
+            logger.error("%s already exists, not moving %s", plan.dest, f)
+            continue
+
+        targets[plan.dest] = f
+        plans.append(plan)
+
+    return plans
+
+
+def move(plan):
+    if plan.src != plan.dest:
+        try:
+            shutil.move(plan.src, plan.dest)
+        except OSError as e:
+            # the others carry on, this file keeps its place and its tags
+            logger.error("Moving %s to %s failed: %s", plan.src, plan.dest, e)
+            return None
+    return plan
+
+
+def sort_files(files, basedir, dr, tags_exe, jobs=1):
+    plans = plan_moves(files, basedir, tags_exe)
+    if dr:
+        return plans
+
+    for destdir in {plan.destdir for plan in plans}:
+        os.makedirs(destdir, exist_ok=True)
+
+    new_tags = {}
+    for plan in bounded_map(move, plans, jobs):
+        if plan is not None:
+            new_tags[plan.dest] = plan.tags
+
+    if len(new_tags) > 0:
+        set_tags_many(new_tags, tags_exe=tags_exe)
+
+    return plans
 
 
 @click.command("sort_docs")
@@ -88,18 +146,40 @@ def move(f, basedir, dr, tags_exe):
 )
 @click.option("--tags", type=click.Path(exists=True, dir_okay=False, executable=True))
 @click.option("--dry-run", "-s", is_flag=True)
-def main(files, outputdir, dry_run, tags):
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1)
+@click.option(
+    "--watch",
+    "watch_dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Keep running and sort files as they arrive in this directory",
+)
+@click.option(
+    "--settle",
+    default=2.0,
+    help="Seconds a file has to stay unchanged before it is picked up",
+)
+@click.option("--polling", is_flag=True, help="Poll instead of using inotify")
+def main(files, outputdir, dry_run, tags, jobs, watch_dir, settle, polling):
     print("BEGIN")
     try:
-        if len(files) == 0:
+        if len(files) == 0 and watch_dir is None:
             print("No files given, do nothing")
         if len(files) == 1 and files[0] == "-":
             # read from stdin
             files = sys.stdin.read().strip().split("\n")
 
         logger.debug("Destination: %s", outputdir)
-        for f in files:
-            move(f, outputdir, dr=dry_run, tags_exe=tags)
+        sort_files(files, outputdir, dry_run, tags, jobs=jobs)
+
+        if watch_dir is not None:
+            logger.info("Watching %s", watch_dir)
+            for batch in watch(
+                watch_dir, settle=settle, recursive=False, polling=polling
+            ):
+                try:
+                    sort_files(batch, outputdir, dry_run, tags, jobs=jobs)
+                except Exception as e:
+                    logger.error("Caught exception: %s" % str(e), exc_info=True)
 
     except Exception as e:
         logger.error("Caught exception: %s" % str(e), exc_info=True)
@@ -6,19 +6,28 @@ import os
 import sys
 from datetime import datetime
 
+from pathlib import Path
+
 import click
 
+from .api import PaperlessClient
+from .cache import remote_state_path
+from .ingest import ensure_tag, file_tags, get_all_tags, get_remote_documents
+from .journal import Journal
 from .log import get_logger
-from .tags import get_tags, set_tags
+from .preprocess import inspect_many
+from .rules import DEFAULT_RULES, Rules
+from .tags import get_tags, get_tags_many, set_tags_many
 from .filename import parse_filename, format_filename
 
 
 logger = get_logger("sync_tags", level=logging.DEBUG)
 
 
-def sync(file, dr, tags_exe):
+def sync(file, dr, tags_exe, finder_tags=None):
     logger.info(file)
-    finder_tags = get_tags(file, tags_exe=tags_exe)
+    if finder_tags is None:
+        finder_tags = get_tags(file, tags_exe=tags_exe)
     logger.debug("Finder tags: %s", ", ".join(finder_tags))
     name_info = parse_filename(os.path.basename(file))
     logger.debug(name_info)
@@ -39,7 +48,124 @@ def sync(file, dr, tags_exe):
         logger.info("%s => %s", file, dest)
         os.rename(file, dest)
 
-        set_tags(dest, total_tags, tags_exe=tags_exe)
+        return dest, total_tags
+
+
+# documents per bulk_edit request
+BULK_SIZE = 1000
+
+# tags --prune leaves alone
+KEEP_TAGS = ("ingest",)
+
+
+def plan_bulk_edits(current, desired, prune=False, keep=()):
+    # current and desired map document ids to sets of tag ids. Edits are
+    # grouped either by tag or by the whole add/remove set of a document,
+    # whichever needs fewer requests.
+    by_tag = {}
+    by_set = {}
+    for doc_id, want in desired.items():
+        have = current.get(doc_id, set())
+        add = want - have
+        remove = (have - want - set(keep)) if prune else set()
+        if not add and not remove:
+            continue
+
+        for tag in add:
+            by_tag.setdefault(("add_tag", tag), []).append(doc_id)
+        for tag in remove:
+            by_tag.setdefault(("remove_tag", tag), []).append(doc_id)
+        by_set.setdefault((frozenset(add), frozenset(remove)), []).append(doc_id)
+
+    tag_edits = [
+        (method, {"tag": tag}, sorted(docs)) for (method, tag), docs in by_tag.items()
+    ]
+    set_edits = [
+        (
+            "modify_tags",
+            {"add_tags": sorted(add), "remove_tags": sorted(remove)},
+            sorted(docs),
+        )
+        for (add, remove), docs in by_set.items()
+    ]
+    return min(tag_edits, set_edits, key=len)
+
+
+def bulk_edit(client, documents, method, parameters):
+    for i in range(0, len(documents), BULK_SIZE):
+        r = client.post(
+            "/api/documents/bulk_edit/",
+            json={
+                "documents": documents[i : i + BULK_SIZE],
+                "method": method,
+                "parameters": parameters,
+            },
+        )
+        r.raise_for_status()
+
+
+def sync_remote(files, client, rules, tags_exe, dr, prune=False, journal=None, jobs=1):
+    # find the documents by content, the files might have been renamed since
+    remote = {
+        checksum: doc_id
+        for doc_id, checksum in get_remote_documents(
+            client, journal=journal, jobs=jobs
+        ).items()
+    }
+    documents = {}
+    for path, checksum, _, _, error in inspect_many(files):
+        if error is not None:
+            logger.error("Cannot read %s: %s", path, error)
+            continue
+        if checksum not in remote:
+            logger.warning("%s is not on the server", path)
+            continue
+        documents[remote[checksum]] = path
+    logger.info("%d of %d files are on the server", len(documents), len(files))
+
+    finder_tags = get_tags_many(list(documents.values()), tags_exe=tags_exe)
+    wanted = {
+        doc_id: file_tags(path, finder_tags[path], rules)[1]
+        for doc_id, path in documents.items()
+    }
+
+    tags_to_ids = get_all_tags(client)
+    for tag in set().union(*wanted.values()) - tags_to_ids.keys():
+        if dr:
+            logger.info("Would create tag %s", tag)
+            tags_to_ids[tag] = f"{tag} (NEW)"
+        else:
+            ensure_tag(client, tag, tags_to_ids)
+    desired = {
+        doc_id: {tags_to_ids[tag] for tag in tags} for doc_id, tags in wanted.items()
+    }
+
+    current = {
+        doc["id"]: set(doc["tags"])
+        for doc in client.iter_results("documents", jobs=jobs, fields="id,tags")
+        if doc["id"] in desired
+    }
+
+    keep = {tags_to_ids[tag] for tag in KEEP_TAGS if tag in tags_to_ids}
+    edits = plan_bulk_edits(current, desired, prune=prune, keep=keep)
+
+    names = {tag_id: name for name, tag_id in tags_to_ids.items()}
+    for method, parameters, docs in edits:
+        logger.info(
+            "%s %s on %d documents",
+            method,
+            {
+                k: [names.get(t, t) for t in v]
+                if isinstance(v, list)
+                else names.get(v, v)
+                for k, v in parameters.items()
+            },
+            len(docs),
+        )
+        if not dr:
+            bulk_edit(client, docs, method, parameters)
+
+    return edits
 
 
 @click.command("sync_tags")
@@ -50,7 +176,28 @@ def sync(file, dr, tags_exe):
 )
 @click.option("--tags", type=click.Path(exists=True, dir_okay=False, executable=True))
 @click.option("--dry-run", "-s", is_flag=True)
-def main(files, dry_run, tags):
+@click.option("--url", help="Push the tags of already ingested files to paperless")
+@click.option("--token")
+@click.option(
+    "--rules",
+    "rules_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=DEFAULT_RULES,
+    show_default=True,
+)
+@click.option(
+    "--prune",
+    is_flag=True,
+    help="Also remove tags the files do not have from the documents",
+)
+@click.option(
+    "--state",
+    type=Path,
+    help="SQLite journal, caches the checksums of remote documents "
+    "(default: one per server in the cache directory)",
+)
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=4)
+def main(files, dry_run, tags, url, token, rules_file, prune, state, jobs):
     logger.debug(files)
     try:
         if len(files) == 0:
@@ -63,7 +210,47 @@ def main(files, dry_run, tags):
         logger.debug(files)
         for file in files:
             assert os.path.exists(file), "File %s does not exist" % file
-            sync(file, dry_run, tags)
+
+        if url is not None:
+            assert token is not None, "Remote mode needs --token"
+            client = PaperlessClient(url, token, max_connections=jobs)
+            if state is None:
+                state = remote_state_path(url)
+            journal = Journal(state)
+            try:
+                edits = sync_remote(
+                    files,
+                    client,
+                    Rules.load(rules_file),
+                    tags,
+                    dry_run,
+                    prune=prune,
+                    journal=journal,
+                    jobs=jobs,
+                )
+            finally:
+                journal.close()
+            print(len(edits), "bulk edits,", "API:", client.summary())
+            return
+
+        try:
+            finder_tags = get_tags_many(files, tags_exe=tags)
+        except Exception as e:
+            # sync() looks them up file by file instead
+            logger.warning("Batch tag lookup failed: %s", e)
+            finder_tags = {}
+
+        new_tags = {}
+        try:
+            for file in files:
+                synced = sync(file, dry_run, tags, finder_tags=finder_tags.get(file))
+                if synced is not None:
+                    dest, total_tags = synced
+                    new_tags[dest] = total_tags
+        finally:
+            # files renamed before an error still get their tags
+            if len(new_tags) > 0:
+                set_tags_many(new_tags, tags_exe=tags)
     except:
         logger.error("Exception occurred", exc_info=True)
 
@@ -1,16 +1,179 @@
+import errno
+import functools
+import os
+import plistlib
+import shutil
 import subprocess
+import sys
 
+# keep command lines well below ARG_MAX
+BATCH_SIZE = 256
 
-def get_tags(f, tags_exe=None):
-    #  print(tags_exe)
-    tags_exe = tags_exe or subprocess.check_output(["which", "tag"]).decode().strip()
-    output = subprocess.check_output([tags_exe, "--list", "--no-name", f])
-    tagstr = output.decode("utf-8").strip()
+# "auto" reads the finder tag attribute directly where possible, "tag" always
+# shells out to the tag executable
+BACKEND = os.environ.get("DOCUMENT_HELPERS_TAG_BACKEND", "auto")
+
+XATTR_NAME = "com.apple.metadata:_kMDItemUserTags"
+if sys.platform.startswith("linux"):
+    # linux only lets unprivileged processes use the user namespace, which is
+    # also where samba/netatalk put the mac attributes
+    XATTR_NAME = "user." + XATTR_NAME
+
+_NO_ATTR = (errno.ENODATA, getattr(errno, "ENOATTR", errno.ENODATA), errno.ENOTSUP)
+
+try:
+    import xattr
+except ImportError:
+    xattr = None
+
+
+def have_xattr():
+    return hasattr(os, "getxattr") or xattr is not None
+
+
+def use_xattr(tags_exe=None):
+    # an explicitly given executable always wins
+    if tags_exe is not None or BACKEND == "tag":
+        return False
+    if BACKEND == "xattr":
+        return True
+    return have_xattr()
+
+
+def decode_tags(raw):
+    # entries look like "Name" or "Name\n6", the number being the finder color
+    return {entry.split("\n")[0] for entry in plistlib.loads(raw)}
+
+
+def encode_tags(tags, previous=None):
+    # keep the colors of tags that were already set
+    colors = {entry.split("\n")[0]: entry for entry in previous or []}
+    entries = [colors.get(tag, tag) for tag in sorted(tags)]
+    return plistlib.dumps(entries, fmt=plistlib.FMT_BINARY)
+
+
+def _getxattr(f):
+    try:
+        if hasattr(os, "getxattr"):
+            return os.getxattr(f, XATTR_NAME)
+        return xattr.getxattr(f, XATTR_NAME)
+    except OSError as e:
+        if e.errno in _NO_ATTR:
+            return None
+        raise
+
+
+def _setxattr(f, value):
+    if hasattr(os, "setxattr"):
+        os.setxattr(f, XATTR_NAME, value)
+    else:
+        xattr.setxattr(f, XATTR_NAME, value)
+
+
+def _removexattr(f):
+    try:
+        if hasattr(os, "removexattr"):
+            os.removexattr(f, XATTR_NAME)
+        else:
+            xattr.removexattr(f, XATTR_NAME)
+    except OSError as e:
+        if e.errno not in _NO_ATTR:
+            raise
+
+
+def xattr_get_tags(f):
+    raw = _getxattr(f)
+    if raw is None:
+        return set()
+    return decode_tags(raw)
+
+
+def xattr_set_tags(f, tags):
+    if len(tags) == 0:
+        _removexattr(f)
+        return
+    raw = _getxattr(f)
+    previous = plistlib.loads(raw) if raw is not None else None
+    _setxattr(f, encode_tags(tags, previous))
+
+
+@functools.lru_cache(maxsize=None)
+def find_tags_exe(tags_exe=None):
+    if tags_exe is not None:
+        return tags_exe
+    found = shutil.which("tag")
+    if found is None:
+        raise RuntimeError("tag executable not found")
+    return found
+
+
+def _parse_tags(tagstr):
+    tagstr = tagstr.strip()
     if tagstr == "":
         return set()
     return set(tagstr.split(","))
 
 
+def get_tags(f, tags_exe=None):
+    #  print(tags_exe)
+    if use_xattr(tags_exe):
+        return xattr_get_tags(f)
+    tags_exe = find_tags_exe(tags_exe)
+    output = subprocess.check_output([tags_exe, "--list", "--no-name", f])
+    return _parse_tags(output.decode("utf-8"))
+
+
 def set_tags(f, tags, tags_exe=None):
-    tags_exe = tags_exe or subprocess.check_output(["which", "tag"]).decode().strip()
+    if use_xattr(tags_exe):
+        return xattr_set_tags(f, tags)
+    tags_exe = find_tags_exe(tags_exe)
     subprocess.check_call([tags_exe, "--set", ",".join(tags), f])
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def get_tags_many(paths, tags_exe=None):
+    if use_xattr(tags_exe):
+        return {f: xattr_get_tags(f) for f in paths}
+    tags_exe = find_tags_exe(tags_exe)
+    result = {}
+    for chunk in _chunks(list(paths), BATCH_SIZE):
+        output = subprocess.check_output(
+            [tags_exe, "--list", "--name", *map(str, chunk)]
+        )
+        lines = output.decode("utf-8").rstrip("\n").split("\n")
+
+        if len(lines) != len(chunk):
+            # names with newlines confuse the line based output
+            for f in chunk:
+                result[f] = get_tags(f, tags_exe=tags_exe)
+            continue
+
+        # one line per file in argument order: name, then a tab and the tags
+        for f, line in zip(chunk, lines):
+            _, sep, tagstr = line.rpartition("\t")
+            result[f] = _parse_tags(tagstr) if sep else set()
+
+    return result
+
+
+def set_tags_many(mapping, tags_exe=None):
+    if use_xattr(tags_exe):
+        for f, tags in mapping.items():
+            xattr_set_tags(f, tags)
+        return
+    tags_exe = find_tags_exe(tags_exe)
+
+    # one invocation per distinct tag set
+    groups = {}
+    for f, tags in mapping.items():
+        groups.setdefault(frozenset(tags), []).append(f)
+
+    for tags, files in groups.items():
+        for chunk in _chunks(files, BATCH_SIZE):
+            subprocess.check_call(
+                [tags_exe, "--set", ",".join(sorted(tags)), *map(str, chunk)]
+            )
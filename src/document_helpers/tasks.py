@@ -0,0 +1,128 @@
+import logging
+import threading
+
+from .log import get_logger
+
+logger = get_logger("tasks", level=logging.DEBUG)
+
+DONE = ("SUCCESS", "FAILURE", "REVOKED")
+
+# ids that are missing from the task list (acknowledged in the UI, say) are
+# looked up one by one, but only this many per round
+MAX_SINGLE_LOOKUPS = 20
+
+
+class TaskTracker:
+    # follows the consume tasks of uploaded documents on a background thread,
+    # so uploads carry on while paperless works through its queue
+    def __init__(self, client, on_done, interval=1.0, max_interval=30.0):
+        self.client = client
+        self.on_done = on_done
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        # held while finished tasks are handed to on_done, close() takes it to
+        # make sure no callback runs once it returned
+        self.done_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, task_id, payload):
+        with self.lock:
+            self.pending[task_id] = payload
+            # something new is in the queue, look again soon
+            self.interval = self.min_interval
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+    def fetch(self, task_ids):
+        # one request for everything paperless still lists
+        tasks = {t["task_id"]: t for t in self.client.get_json("/api/tasks/")}
+
+        missing = [t for t in task_ids if t not in tasks]
+        for task_id in missing[:MAX_SINGLE_LOOKUPS]:
+            for t in self.client.get_json("/api/tasks/", params={"task_id": task_id}):
+                tasks[t["task_id"]] = t
+        return tasks
+
+    def poll(self):
+        with self.lock:
+            task_ids = list(self.pending)
+        if len(task_ids) == 0:
+            return 0
+
+        tasks = self.fetch(task_ids)
+
+        with self.done_lock:
+            if self.closed:
+                return 0
+
+            finished = []
+            with self.lock:
+                for task_id in task_ids:
+                    task = tasks.get(task_id)
+                    if (
+                        task_id in self.pending
+                        and task is not None
+                        and task.get("status") in DONE
+                    ):
+                        finished.append((self.pending.pop(task_id), task))
+
+            for payload, task in finished:
+                try:
+                    self.on_done(payload, task)
+                except Exception:
+                    logger.error(
+                        "Handling task %s failed", task["task_id"], exc_info=True
+                    )
+        return len(finished)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.closed or (self.stopping and len(self) == 0):
+                return
+
+            try:
+                finished = self.poll()
+            except Exception as e:
+                logger.warning("Polling tasks failed: %s", e)
+                finished = 0
+
+            # back off while paperless is busy, speed up when things move
+            with self.lock:
+                if finished > 0:
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.interval * 2, self.max_interval)
+
+    def close(self, timeout=None):
+        # waits up to timeout for the outstanding tasks, returns the payloads
+        # that did not finish in time. on_done is not called after this.
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+        if self.thread.is_alive():
+            # one last look, so tasks that are done by now are still reported
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Polling tasks failed: %s", e)
+
+        with self.done_lock:
+            self.closed = True
+            with self.lock:
+                remaining = list(self.pending.values())
+                self.pending.clear()
+        self.wakeup.set()
+        return remaining
@@ -0,0 +1,169 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT = struct.Struct("iIII")
+
+
+def _scan(directory, recursive):
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from _scan(entry.path, recursive)
+        elif entry.is_file():
+            yield entry.path
+
+
+class InotifyWatcher:
+    def __init__(self, directory, recursive=True):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self.recursive = recursive
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.root = directory
+        self._watch_tree(directory)
+
+    def _watch(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+        self.dirs[wd] = directory
+
+    def _watch_tree(self, directory):
+        self._watch(directory)
+        if not self.recursive:
+            return
+        for dirpath, dirnames, _ in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for d in dirnames:
+                self._watch(os.path.join(dirpath, d))
+
+    def close(self):
+        os.close(self.fd)
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        touched = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # we lost events, fall back to looking at everything
+                touched.extend(_scan(self.root, self.recursive))
+                continue
+
+            directory = self.dirs.get(wd)
+            if directory is None or name.startswith("."):
+                continue
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if self.recursive:
+                    # files may have landed before the watch was in place
+                    self._watch_tree(path)
+                    touched.extend(_scan(path, self.recursive))
+                continue
+
+            touched.append(path)
+        return touched
+
+
+class PollingWatcher:
+    def __init__(self, directory, recursive=True, interval=2.0):
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self.seen = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in _scan(self.directory, self.recursive):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def close(self):
+        pass
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._snapshot()
+        touched = [p for p, sig in snapshot.items() if self.seen.get(p) != sig]
+        self.seen = snapshot
+        return touched
+
+
+def make_watcher(directory, recursive=True, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, recursive=recursive)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory, recursive=recursive)
+
+
+def watch(directory, settle=2.0, recursive=True, polling=False):
+    # yields batches of files once they stopped changing for `settle` seconds,
+    # starting with whatever is already in the directory
+    watcher = make_watcher(directory, recursive=recursive, polling=polling)
+    pending = {path: (None, time.monotonic()) for path in _scan(directory, recursive)}
+
+    try:
+        while True:
+            timeout = settle / 2 if pending else 60
+            for path in watcher.poll(timeout):
+                pending[path] = (None, time.monotonic())
+
+            now = time.monotonic()
+            ready = []
+            for path, (sig, since) in list(pending.items()):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    del pending[path]
+                    continue
+
+                current = (st.st_size, st.st_mtime_ns)
+                if current != sig:
+                    # still being written
+                    pending[path] = (current, now)
+                elif now - since >= settle:
+                    ready.append(path)
+                    del pending[path]
+
+            if ready:
+                yield ready
+    finally:
+        watcher.close()
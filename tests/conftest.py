@@ -0,0 +1,65 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class Request:
+    def __init__(self, method, url, body):
+        parts = urlsplit(url)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        self.body = body
+
+
+class Server:
+    # answers every request with respond(request) -> (status, json[, headers])
+    def __init__(self):
+        self.requests = []
+        self.respond = lambda request: (404, {})
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = Request(self.command, self.path, self.rfile.read(length))
+                server.requests.append(request)
+                status, data, *headers = server.respond(request)
+
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                for key, value in (headers[0] if headers else {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def paths(self, method=None):
+        return [r.path for r in self.requests if method in (None, r.method)]
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(
+        target=server.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
@@ -0,0 +1,120 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from document_helpers import aio
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_probe_documents():
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.url.path))
+        doc_id = int(request.url.path.split("/")[3])
+        return httpx.Response(404 if doc_id % 7 == 0 else 200)
+
+    results = []
+
+    async def main():
+        async with aio.AsyncPaperlessClient(
+            "http://paperless",
+            "x",
+            concurrency=5,
+            transport=httpx.MockTransport(handler),
+        ) as client:
+            docs = ({"id": i} for i in range(1, 31))
+            await aio.probe_documents(
+                client, docs, lambda *r: results.append(r), concurrency=5
+            )
+            return client.stats
+
+    stats = run(main())
+    assert len(results) == 30
+    broken = sorted(doc["id"] for doc, ok, _, _ in results if not ok)
+    assert broken == [7, 14, 21, 28]
+    assert {method for method, _ in seen} == {"HEAD"}
+    assert stats["requests"] == 30 and stats["errors"] == 4
+
+
+def test_retry():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) < 3:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200)
+
+    async def main(method):
+        async with aio.AsyncPaperlessClient(
+            "http://paperless", "x", transport=httpx.MockTransport(handler)
+        ) as client:
+            return await client.request(method, "/api/documents/1/download/")
+
+    assert run(main("GET")).status_code == 200
+    assert calls == ["GET"] * 3
+
+    # uploads are never repeated
+    calls.clear()
+    assert run(main("POST")).status_code == 503
+    assert calls == ["POST"]
+
+
+def test_range_probe_reuses_connections():
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            connections.append(self.client_address)
+            super().setup()
+
+        def do_GET(self):
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes 0-0/1000")
+            self.send_header("Content-Length", "1")
+            self.end_headers()
+            self.wfile.write(b"x")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+
+    async def main():
+        async with aio.AsyncPaperlessClient(
+            f"http://127.0.0.1:{server.server_port}", "x", concurrency=2
+        ) as client:
+            docs = ({"id": i} for i in range(1, 31))
+            await aio.probe_documents(
+                client,
+                docs,
+                lambda *r: results.append(r),
+                probe="range",
+                concurrency=2,
+            )
+
+    try:
+        run(main())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(results) == 30 and all(ok for _, ok, _, _ in results)
+    assert len(connections) <= 2
@@ -0,0 +1,95 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import pytest
+
+from document_helpers import api
+from document_helpers.api import PaperlessClient, RateLimiter
+
+
+def listing(server, n):
+    def respond(request):
+        page = int(request.query.get("page", 1))
+        size = int(request.query["page_size"])
+        ids = list(range(1, n + 1))[(page - 1) * size : page * size]
+        next_url = None
+        if page * size < n:
+            next_url = f"{server.url}/api/documents/?page={page + 1}&page_size={size}"
+        return 200, {
+            "count": n,
+            "next": next_url,
+            "results": [{"id": i} for i in ids],
+        }
+
+    return respond
+
+
+def pages(server):
+    return [int(r.query.get("page", 1)) for r in server.requests]
+
+
+@pytest.mark.parametrize("n, expected", [(7, [1, 2, 3]), (6, [1, 2]), (2, [1])])
+def test_iter_results(server, n, expected):
+    server.respond = listing(server, n)
+    client = PaperlessClient(server.url, "x")
+
+    docs = list(client.iter_results("documents", page_size=3))
+    assert [d["id"] for d in docs] == list(range(1, n + 1))
+    assert pages(server) == expected
+
+
+@pytest.mark.parametrize("n, expected", [(7, [1, 2, 3]), (6, [1, 2]), (2, [1])])
+def test_iter_results_concurrent(server, n, expected):
+    server.respond = listing(server, n)
+    client = PaperlessClient(server.url, "x", max_connections=3)
+
+    docs = list(client.iter_results("documents", page_size=3, jobs=3))
+    assert sorted(d["id"] for d in docs) == list(range(1, n + 1))
+    # the first page tells how many there are, the rest by number
+    assert pages(server)[0] == 1
+    assert sorted(pages(server)) == expected
+
+
+def test_retries(server):
+    def respond(request):
+        if len(server.requests) % 3 == 0:
+            return 200, {"ok": True}
+        status = 429 if len(server.requests) % 3 == 1 else 503
+        return status, {}, {"Retry-After": "0"}
+
+    server.respond = respond
+    client = PaperlessClient(server.url, "x")
+
+    assert client.get_json("/api/tags/") == {"ok": True}
+    assert server.paths() == ["/api/tags/"] * 3
+
+    # uploads are never repeated
+    server.requests.clear()
+    r = client.post("/api/documents/post_document/", data={"title": "a"})
+    assert r.status_code == 429
+    assert server.paths() == ["/api/documents/post_document/"]
+    assert client.stats["requests"] == 2 and client.stats["errors"] == 1
+
+
+def test_rate_limiter(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(api.time, "monotonic", lambda: now[0])
+
+    limiter = RateLimiter(10, burst=2)
+    assert limiter.take() == 0
+    assert limiter.take() == 0
+    # the bucket is empty, the next token comes in a tenth of a second
+    assert limiter.take() == pytest.approx(0.1)
+
+    now[0] += 0.05
+    assert limiter.take() == pytest.approx(0.05)
+    now[0] += 0.06
+    assert limiter.take() == 0
+
+    # a long pause does not save up more than the burst
+    now[0] += 60
+    assert limiter.take() == 0
+    assert limiter.take() == 0
+    assert limiter.take() > 0
@@ -0,0 +1,150 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from document_helpers import cache as cache_module
+from document_helpers import ingest
+from document_helpers.api import PaperlessClient
+from document_helpers.cache import MetadataCache
+from document_helpers.rules import DEFAULT_RULES, Rules
+
+
+def names(items):
+    return 200, {
+        "count": len(items),
+        "next": None,
+        "results": [{"name": name, "id": i} for name, i in items.items()],
+    }
+
+
+def test_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+
+    cache = MetadataCache("http://paperless", ttl=60, directory=tmp_path)
+    assert cache.get("tags") is None
+    cache.put("tags", {"a": 1})
+
+    now[0] += 59
+    assert cache.get("tags") == {"a": 1}
+    # the same server, on disk
+    other = MetadataCache("http://paperless/", ttl=60, directory=tmp_path)
+    assert other.get("tags") == {"a": 1}
+
+    now[0] += 2
+    assert cache.get("tags") is None
+
+
+def test_add_writes_through(tmp_path):
+    cache = MetadataCache("http://paperless", directory=tmp_path)
+    # nothing to add to before the map was fetched once
+    cache.add("tags", "a", 1)
+    assert cache.get("tags") is None
+
+    cache.put("tags", {"a": 1})
+    cache.add("tags", "b", 2)
+    fresh = MetadataCache("http://paperless", directory=tmp_path)
+    assert fresh.get("tags") == {"a": 1, "b": 2}
+
+
+def test_create_invalidates_on_400(tmp_path, server):
+    server.respond = lambda request: (400, {"name": ["exists"]})
+    cache = MetadataCache(server.url, directory=tmp_path)
+    cache.put("tags", {"a": 1})
+    client = PaperlessClient(server.url, "x", cache=cache)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.create("tags", {"name": "b"})
+    assert cache.get("tags") is None
+
+    server.respond = lambda request: (201, {"id": 7})
+    cache.put("tags", {"a": 1})
+    assert client.create("tags", {"name": "b"}) == 7
+    assert cache.get("tags") == {"a": 1, "b": 7}
+
+
+def test_load_name_map_checks_stale_cache(tmp_path, server):
+    server.respond = lambda request: names({"a": 1, "b": 2})
+    cache = MetadataCache(server.url, directory=tmp_path)
+    cache.put("correspondents", {"a": 1})
+    client = PaperlessClient(server.url, "x", cache=cache)
+
+    # b is missing from the cache, but the server has it
+    items = ingest.load_name_map(
+        client,
+        ingest.get_correspondents,
+        ingest.create_correspondent,
+        {"a", "b"},
+        dry_run=False,
+    )
+    assert items == {"a": 1, "b": 2}
+    assert server.paths("POST") == []
+    assert cache.get("correspondents") == {"a": 1, "b": 2}
+
+
+def test_ensure_tag_created_elsewhere(tmp_path, server):
+    def respond(request):
+        if request.method == "POST":
+            return 400, {"name": ["exists"]}
+        return names({"a": 1, "b": 2})
+
+    server.respond = respond
+    client = PaperlessClient(server.url, "x")
+    tags_to_ids = {"a": 1}
+
+    assert ingest.ensure_tag(client, "b", tags_to_ids) == 2
+    assert ingest.ensure_tag(client, "b", tags_to_ids) == 2
+    assert server.paths() == ["/api/tags/", "/api/tags/"]
+
+
+def test_ingest_refreshes_stale_ids(tmp_path, server, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    rules = Rules.load(DEFAULT_RULES)
+    correspondents = {name: i for i, name in enumerate(sorted(rules.correspondents))}
+    document_types = {name: i for i, name in enumerate(sorted(rules.document_types))}
+    tags = {"ingest": 1, "x": 5}
+
+    def respond(request):
+        if request.path == "/api/documents/post_document/":
+            if b'name="tags"\r\n\r\n999\r\n' in request.body:
+                return 400, {"tags": ['Invalid pk "999" - object does not exist.']}
+            return 200, "task-1"
+        if request.path == "/api/tasks/":
+            return 200, []
+        return names(
+            {
+                "/api/tags/": tags,
+                "/api/correspondents/": correspondents,
+                "/api/document_types/": document_types,
+            }[request.path]
+        )
+
+    server.respond = respond
+    # x was deleted and created again since the ids were cached
+    cache = MetadataCache(server.url)
+    cache.put("tags", {"ingest": 1, "x": 999})
+    cache.put("correspondents", correspondents)
+    cache.put("document_types", document_types)
+
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "2021-01-01--A__x.pdf").write_text("a")
+
+    result = CliRunner().invoke(
+        ingest.main,
+        [str(source), "--url", server.url, "--token", "x"]
+        + ["--failed", str(tmp_path / "failed")],
+    )
+    assert result.exit_code == 0, result.output
+
+    posts = [r.body for r in server.requests if r.method == "POST"]
+    assert len(posts) == 2
+    assert b'name="tags"\r\n\r\n5\r\n' in posts[1]
+    assert "Uploaded 1 files" in result.output
+    assert not (tmp_path / "failed").exists()
+    assert MetadataCache(server.url).get("tags") == tags
@@ -0,0 +1,135 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from document_helpers import check
+from document_helpers.check import (
+    Format,
+    Reporter,
+    _recover_file,
+    expected_files,
+    fast_copy,
+    percentile,
+    recovery_candidates,
+    unique_name,
+)
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 51
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
+
+
+def test_reporter_ndjson(capsys):
+    reporter = Reporter(Format.ndjson)
+    reporter.result({"id": 1, "status": "ok"}, 0.5)
+    reporter.result({"id": 2, "status": "broken"}, 1.5)
+    # lines are written as results come in
+    first = capsys.readouterr().out.splitlines()
+    assert [json.loads(l)["id"] for l in first] == [1, 2]
+
+    summary = reporter.finish(broken=1)
+    last = json.loads(capsys.readouterr().out)
+    assert last == {"summary": summary}
+    assert summary["checked"] == 2
+    assert summary["broken"] == 1
+    assert summary["latency"]["max"] == 1.5
+
+
+def test_reporter_json(capsys):
+    reporter = Reporter(Format.json)
+    reporter.result({"id": 1, "status": "ok"}, 0.25)
+    assert capsys.readouterr().out == ""
+
+    reporter.finish()
+    report = json.loads(capsys.readouterr().out)
+    assert report["results"] == [{"id": 1, "status": "ok", "seconds": 0.25}]
+    assert report["summary"]["latency"]["p50"] == 0.25
+
+
+META = {
+    "original_filename": "up5.pdf",
+    "media_filename": "2021/doc5.pdf",
+    "original_checksum": hashlib.md5(b"original").hexdigest(),
+    "original_size": 8,
+    "has_archive_version": True,
+    "archive_media_filename": "2021/doc5-archive.pdf",
+    "archive_checksum": hashlib.md5(b"archive").hexdigest(),
+}
+
+
+def test_recovery_candidates_match_offline_check(tmp_path):
+    originals = tmp_path / "orig"
+    archive = tmp_path / "arch"
+
+    original, media = recovery_candidates(5, META, originals, archive)
+    expected = {
+        kind: (Path(path), checksum)
+        for _, kind, path, _, checksum in expected_files(5, META, originals, archive)
+    }
+    assert original == expected["original"]
+    assert media == expected["archive"]
+    assert original == (originals / "2021" / "doc5.pdf", META["original_checksum"])
+
+    assert recovery_candidates(5, META, None, None) == ((None, None), (None, None))
+
+
+def test_unique_name():
+    used = set()
+    assert unique_name("a.pdf", 1, used) == "a.pdf"
+    assert unique_name("a.pdf", 2, used) == "a--2.pdf"
+    assert unique_name("b.pdf", 3, used) == "b.pdf"
+    assert used == {"a.pdf", "a--2.pdf", "b.pdf"}
+
+
+def test_fast_copy(tmp_path):
+    src = tmp_path / "src.pdf"
+    src.write_bytes(os.urandom(300_000))
+    os.utime(src, (1_600_000_000, 1_600_000_000))
+    dst = tmp_path / "dst.pdf"
+    dst.write_bytes(b"old and longer than nothing")
+
+    fast_copy(src, dst)
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_mtime == 1_600_000_000
+
+
+@pytest.mark.parametrize("link", [False, True])
+def test_recover_file(tmp_path, link):
+    src = tmp_path / "orig.pdf"
+    src.write_bytes(b"original")
+    dest = tmp_path / "out" / "up5.pdf"
+    dest.parent.mkdir()
+    dest.write_bytes(b"stale")
+
+    assert _recover_file((5, src, dest, META["original_checksum"], link)) == (
+        5,
+        dest,
+        True,
+    )
+    assert dest.read_bytes() == b"original"
+    # a hard link shares the inode, a copy does not
+    assert os.path.samefile(src, dest) == link
+
+    src.write_bytes(b"changed")
+    assert not _recover_file((5, src, dest, META["original_checksum"], False))[2]
+
+
+def test_async_engine_without_httpx(monkeypatch):
+    monkeypatch.setattr(check.aio, "have_httpx", lambda: False)
+    result = CliRunner().invoke(
+        check.app, ["http://127.0.0.1:1", "token", "--engine", "async"]
+    )
+    assert result.exit_code == 2
+    assert "needs httpx" in result.output
@@ -4,7 +4,7 @@ sys.path.insert(0, parent + '/../')
 
 import pytest
 
-from document_helpers.filename import parse_filename, format_filename
+from document_helpers.filename import parse_filename, parse_filenames, format_filename
 from datetime import datetime
 
 def test_parse_filename():
@@ -63,3 +63,19 @@ def test_format_filename():
     assert format_filename(name, 
                            now, 
                            set(["Tag With Spaces"])) == "2018-08-17--SOMENAME__Tag With Spaces.pdf"
+
+def test_parse_filenames():
+    res = list(parse_filenames(["2018-08-01--a__x.pdf", "no extension", "b.pdf"]))
+    assert res[0].dt == datetime(year=2018, month=8, day=1)
+    assert res[0].tags == set(["x"])
+    assert res[1] is None
+    assert res[2].name == "b.pdf"
+
+def test_parse_filename_cached_copy():
+    res = parse_filename("2018-08-01--3482274514__google_invoice.pdf")
+    res.tags.add("modified")
+    res.dt = None
+
+    res = parse_filename("2018-08-01--3482274514__google_invoice.pdf")
+    assert res.dt == datetime(year=2018, month=8, day=1)
+    assert res.tags == set(["google", "invoice"])
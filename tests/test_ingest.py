@@ -0,0 +1,170 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import subprocess
+
+import pytest
+
+from document_helpers import ingest
+from document_helpers.cache import remote_state_path
+from document_helpers.journal import Journal
+
+
+def test_finder_tags_batch_failure(monkeypatch):
+    def broken(paths):
+        raise subprocess.CalledProcessError(1, "tag")
+
+    monkeypatch.setattr(ingest, "get_tags_many", broken)
+    items = [("a.pdf", 1), ("b.pdf", 2)]
+    # no tags yet, process() looks them up for each file on its own
+    assert list(ingest.with_finder_tags(items)) == [
+        ("a.pdf", 1, None),
+        ("b.pdf", 2, None),
+    ]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in [
+        "a.pdf",
+        "b.txt",
+        ".hidden.pdf",
+        "sub/c.pdf",
+        "sub/skip/d.pdf",
+        "sub/deeper/e.pdf",
+        "sub/deeper/more/f.pdf",
+        "other/g.pdf",
+    ]:
+        path = tmp_path / "src" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path / "src"
+
+
+def found(root, **kwargs):
+    return sorted(
+        os.path.relpath(p, root) for p in ingest.discover(str(root), **kwargs)
+    )
+
+
+def test_discover(tree):
+    assert found(tree) == [
+        "a.pdf",
+        "b.txt",
+        "other/g.pdf",
+        "sub/c.pdf",
+        "sub/deeper/e.pdf",
+        "sub/deeper/more/f.pdf",
+        "sub/skip/d.pdf",
+    ]
+    assert found(tree, include=["*.pdf"], exclude=["skip", "other/*"]) == [
+        "a.pdf",
+        "sub/c.pdf",
+        "sub/deeper/e.pdf",
+        "sub/deeper/more/f.pdf",
+    ]
+    assert found(tree, include=["other/*"]) == ["other/g.pdf"]
+    assert found(tree, max_depth=0) == ["a.pdf", "b.txt"]
+    assert found(tree, max_depth=1, exclude=["*.txt"]) == [
+        "a.pdf",
+        "other/g.pdf",
+        "sub/c.pdf",
+    ]
+
+
+def test_accepted_matches_discover(tree):
+    kwargs = dict(include=["*.pdf"], exclude=["skip"], max_depth=2)
+    root = str(tree)
+    walked = []
+    for directory, _, names in os.walk(root):
+        walked += [os.path.join(directory, name) for name in names]
+
+    accepted = [
+        os.path.relpath(p, root)
+        for p in walked
+        if not os.path.basename(p).startswith(".")
+        and ingest._accepted(p, root, **kwargs)
+    ]
+    assert sorted(accepted) == found(tree, **kwargs)
+
+
+def test_discover_filesystem_root(tree, monkeypatch):
+    # relative paths below "/" keep their first character
+    seen = []
+    matches = ingest._matches
+
+    def record(name, relpath, patterns):
+        seen.append(relpath)
+        return matches(name, relpath, patterns)
+
+    monkeypatch.setattr(ingest, "_matches", record)
+    next(ingest.discover("/", max_depth=0), None)
+    assert all(not relpath.startswith("/") for relpath in seen)
+    assert all(os.path.exists(os.path.join("/", relpath)) for relpath in seen)
+
+
+class RemoteClient:
+    def __init__(self, ids):
+        self.ids = ids
+        self.metadata = []
+
+    def iter_results(self, endpoint, jobs=1, **params):
+        return ({"id": i} for i in self.ids)
+
+    def get_metadata(self, doc_id):
+        self.metadata.append(doc_id)
+        return {"original_checksum": f"sum{doc_id}"}
+
+
+def test_remote_checksums_cached_per_server(tmp_path):
+    path = remote_state_path("http://paperless/", tmp_path)
+    assert path == remote_state_path("http://paperless", tmp_path)
+
+    client = RemoteClient([1, 2, 3])
+    with Journal(path) as journal:
+        assert ingest.get_remote_checksums(client, journal=journal) == {
+            "sum1",
+            "sum2",
+            "sum3",
+        }
+
+    # the next run only asks for documents added since, and forgets deleted ones
+    client = RemoteClient([2, 3, 4])
+    with Journal(path) as journal:
+        assert ingest.get_remote_documents(client, journal=journal) == {
+            2: "sum2",
+            3: "sum3",
+            4: "sum4",
+        }
+    assert client.metadata == [4]
+
+
+class UploadResponse:
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return "task-1"
+
+
+def test_upload_size_of_moved_file(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"x" * 1000)
+
+    class Client:
+        def post(self, endpoint, data, headers):
+            data.read()
+            # sorted away as soon as paperless has it
+            path.rename(tmp_path / "b.pdf")
+            return UploadResponse()
+
+    assert ingest.upload(Client(), str(path), [("title", "a")]) == (
+        "task-1",
+        None,
+        [],
+        1000,
+    )
@@ -0,0 +1,111 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import time
+
+import pytest
+
+from document_helpers.journal import CheckState, Journal
+
+
+def test_journal_is_done(tmp_path):
+    f = tmp_path / "a.pdf"
+    f.write_text("a")
+
+    with Journal(tmp_path / "state.db") as journal:
+        assert not journal.is_done(f)
+
+        journal.record(f, os.stat(f), "abc", "failed", error="nope")
+        assert not journal.is_done(f)
+
+        journal.record(f, os.stat(f), "abc", "uploaded", task_id="t1")
+        assert journal.is_done(f)
+        assert journal.find_uploaded("abc") == (str(f), "t1")
+
+        # changed on disk
+        f.write_text("ab")
+        assert not journal.is_done(f)
+
+
+def test_journal_reserve(tmp_path):
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.pdf"
+    a.write_text("x")
+    b.write_text("x")
+
+    with Journal(tmp_path / "state.db") as journal:
+        assert journal.reserve(a, os.stat(a), "abc") is None
+        # a retry of the same path keeps its claim
+        assert journal.reserve(a, os.stat(a), "abc") is None
+        assert journal.reserve(b, os.stat(b), "abc") == (str(a), "uploading", None)
+
+        journal.record(a, os.stat(a), "abc", "uploaded", task_id="t1")
+        assert journal.reserve(b, os.stat(b), "abc") == (str(a), "uploaded", "t1")
+
+        # a failed upload gives up the claim
+        journal.set_status(a, "failed", error="nope")
+        assert journal.reserve(b, os.stat(b), "abc") is None
+
+
+def test_journal_drops_stale_reservations(tmp_path):
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.pdf"
+    a.write_text("x")
+    b.write_text("x")
+
+    with Journal(tmp_path / "state.db") as journal:
+        assert journal.reserve(a, os.stat(a), "abc") is None
+    # the run was killed before the upload finished
+    a.unlink()
+
+    with Journal(tmp_path / "state.db") as journal:
+        assert journal.lookup(a) is None
+        assert journal.reserve(b, os.stat(b), "abc") is None
+
+
+def test_journal_unconfirmed(tmp_path):
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.pdf"
+    a.write_text("x")
+    b.write_text("x")
+
+    with Journal(tmp_path / "state.db") as journal:
+        journal.record(a, os.stat(a), "abc", "unconfirmed", task_id="t1")
+        # not uploaded again while paperless has not answered
+        assert journal.is_done(a)
+        assert journal.reserve(b, os.stat(b), "abc") == (str(a), "unconfirmed", "t1")
+
+    with Journal(tmp_path / "state.db") as journal:
+        assert journal.unconfirmed() == [(str(a), "t1")]
+        journal.set_status(a, "failed", error="broken pdf")
+        assert journal.unconfirmed() == []
+        assert not journal.is_done(a)
+
+
+def test_check_state_select(tmp_path):
+    docs = [{"id": i, "modified": "m"} for i in range(1, 15)]
+
+    with CheckState(tmp_path / "check.db", sweep_days=7) as state:
+        assert list(state.select(docs)) == docs
+
+        for doc in docs:
+            state.record(doc["id"], "m", ok=doc["id"] != 3)
+
+        now = time.time()
+        assert [d["id"] for d in state.select(docs, now=now)] == [3]
+
+        docs[4]["modified"] = "changed"
+        assert [d["id"] for d in state.select(docs, now=now)] == [3, 5]
+
+        # the next day one seventh of the documents is due again
+        tomorrow = now + 86400
+        day = int(tomorrow // 86400)
+        due = [d["id"] for d in state.select(docs, now=tomorrow)]
+        assert due == sorted(
+            set([3, 5] + [d["id"] for d in docs if d["id"] % 7 == day % 7])
+        )
+
+        # after a full period everything is due
+        assert len(list(state.select(docs, now=now + 7 * 86400))) == len(docs)
@@ -0,0 +1,57 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import json
+
+from document_helpers.metrics import Histogram, Metrics, endpoint_of
+
+
+def test_endpoint_of():
+    assert endpoint_of("/api/documents/12/download/") == "/api/documents/{id}/download/"
+    assert endpoint_of("http://host/api/tags/?page=2") == "/api/tags/"
+
+
+def test_histogram_quantile():
+    h = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 2.0):
+        h.observe(value)
+    assert h.counts == [2, 1, 1]
+    assert h.quantile(0.5) == 0.1
+    assert h.quantile(0.75) == 1.0
+    assert h.quantile(1.0) == 2.0
+
+
+def test_disabled_records_nothing():
+    metrics = Metrics()
+    with metrics.phase("upload"):
+        pass
+    metrics.observe_request("GET", "/api/tags/", 0.1)
+    items = [1, 2]
+    assert metrics.timed("discovery", items) is items
+    assert metrics.phases == {} and metrics.requests == {}
+
+
+def test_export(tmp_path):
+    metrics = Metrics()
+    metrics.enable()
+    with metrics.phase("upload"):
+        pass
+    assert list(metrics.timed("discovery", [1, 2])) == [1, 2]
+    metrics.observe_request("GET", "/api/documents/3/metadata/", 0.02)
+
+    assert metrics.phases["discovery"].count == 3
+    assert metrics.phases["upload"].count == 1
+
+    metrics.export(tmp_path / "m.json")
+    data = json.loads((tmp_path / "m.json").read_text())
+    assert data["requests"][0]["endpoint"] == "/api/documents/{id}/metadata/"
+
+    metrics.export(tmp_path / "m.prom")
+    text = (tmp_path / "m.prom").read_text()
+    assert 'document_helpers_phase_seconds_count{phase="upload"} 1' in text
+    assert (
+        'document_helpers_http_request_seconds_bucket{method="GET",'
+        'endpoint="/api/documents/{id}/metadata/",le="+Inf"} 1'
+    ) in text
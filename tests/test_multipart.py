@@ -0,0 +1,77 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import email
+import email.policy
+
+import pytest
+
+from document_helpers.multipart import MultipartStream
+
+
+def read_all(stream, size):
+    chunks = []
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return chunks
+        chunks.append(chunk)
+
+
+def test_multipart_stream(tmp_path):
+    path = tmp_path / 'Über "quoted".pdf'
+    content = os.urandom(10000)
+    path.write_bytes(content)
+
+    fields = [("tags", 1), ("tags", 2), ("title", "Über")]
+    with MultipartStream(fields, "document", path, chunk_size=1024) as stream:
+        chunks = read_all(stream, 4096)
+        body = b"".join(chunks)
+        assert len(body) == len(stream)
+        # never more than a chunk of the file at a time
+        assert max(len(c) for c in chunks[1:-1]) <= 1024
+
+        message = email.message_from_bytes(
+            f"Content-Type: {stream.content_type}\r\n\r\n".encode() + body,
+            policy=email.policy.HTTP,
+        )
+
+    parts = list(message.iter_parts())
+    assert [p.get_param("name", header="content-disposition") for p in parts] == [
+        "tags",
+        "tags",
+        "title",
+        "document",
+    ]
+    assert parts[2].get_payload(decode=True) == "Über".encode()
+    assert parts[3].get_filename() == "Über %22quoted%22.pdf"
+    assert parts[3].get_content_type() == "application/pdf"
+    assert parts[3].get_payload(decode=True) == content
+
+
+def test_multipart_stream_shrinking_file(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"x" * 100)
+    with MultipartStream([], "document", path, chunk_size=10) as stream:
+        path.write_bytes(b"x" * 10)
+        with pytest.raises(OSError):
+            read_all(stream, 100)
+
+
+def test_multipart_stream_growing_file(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"x" * 100)
+    with MultipartStream([], "document", path, chunk_size=64) as stream:
+        with open(path, "ab") as fh:
+            fh.write(b"y" * 28)
+        sent = []
+        with pytest.raises(OSError, match="grew"):
+            while True:
+                chunk = stream.read(1000)
+                if not chunk:
+                    break
+                sent.append(chunk)
+        # never more than the declared length
+        assert sum(map(len, sent)) <= len(stream)
@@ -0,0 +1,123 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from document_helpers import preprocess
+from document_helpers.pool import prefetch
+from document_helpers.preprocess import inspect_file, inspect_many, scan_pdf
+
+PDF = b"""%PDF-1.4
+1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj
+2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >> endobj
+3 0 obj << /Type /Page /Parent 2 0 R >> endobj
+4 0 obj << /Type/Page /Parent 2 0 R >> endobj
+5 0 obj << /CreationDate (D:20190314120000+01'00') >> endobj
+trailer << /Root 1 0 R /Info 5 0 R >>
+%%EOF
+"""
+
+
+def test_scan_pdf():
+    assert scan_pdf(PDF) == (2, datetime(2019, 3, 14))
+
+    # pages hidden in object streams, date only in the xmp packet
+    compressed = b"%PDF-1.5 /Type /Pages /Count 12 <xmp:CreateDate>2020-02-01T10:00"
+    assert scan_pdf(compressed) == (12, datetime(2020, 2, 1))
+
+    assert scan_pdf(b"%PDF-1.4 /CreationDate (D:20191399)") == (None, None)
+
+
+def test_inspect_file(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(PDF)
+    text = tmp_path / "b.txt"
+    text.write_bytes(b"/Type /Page")
+    empty = tmp_path / "c.pdf"
+    empty.write_bytes(b"")
+
+    assert inspect_file(pdf) == (
+        pdf,
+        hashlib.md5(PDF).hexdigest(),
+        2,
+        datetime(2019, 3, 14),
+        None,
+    )
+    assert inspect_file(text)[2:] == (None, None, None)
+    assert inspect_file(empty)[1] == hashlib.md5(b"").hexdigest()
+
+    assert inspect_file(tmp_path / "gone.pdf")[1:4] == (None, None, None)
+
+    # a file missing by the time it is hashed fails on its own
+    paths = [pdf, tmp_path / "gone.pdf", text, empty] * 2
+    results = {r[0]: r for r in inspect_many(paths, jobs=2)}
+    assert results.keys() == set(paths)
+    assert results[pdf][2] == 2
+    assert results[text][4] is None
+    assert "gone.pdf" in results[tmp_path / "gone.pdf"][4]
+
+
+def test_inspect_many_pool_size(tmp_path, monkeypatch):
+    pools = []
+
+    def pool(max_workers):
+        pools.append(max_workers)
+        return ThreadPoolExecutor(max_workers)
+
+    monkeypatch.setattr(preprocess, "process_pool", pool)
+    paths = []
+    for i in range(6):
+        paths.append(tmp_path / f"{i}.pdf")
+        paths[-1].write_bytes(PDF)
+
+    # a small batch is not worth starting the workers for
+    assert len(list(inspect_many(iter(paths[:4]), jobs=8))) == 4
+    assert pools == []
+
+    assert len(list(inspect_many(iter(paths), jobs=8))) == 6
+    assert pools == [6]
+
+    with ThreadPoolExecutor(2) as executor:
+        assert len(list(inspect_many(paths, jobs=2, executor=executor))) == 6
+    assert pools == [6]
+
+
+def test_prefetch():
+    assert list(prefetch(range(100), 4)) == list(range(100))
+
+    def broken():
+        yield 1
+        raise ValueError("nope")
+
+    it = prefetch(broken(), 4)
+    assert next(it) == 1
+    with pytest.raises(ValueError):
+        next(it)
+
+    closed = []
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.append(True)
+
+    it = prefetch(endless(), 2)
+    assert next(it) == 0
+    it.close()
+    # the producer notices and closes the source
+    for _ in range(50):
+        if closed:
+            break
+        time.sleep(0.1)
+    assert closed
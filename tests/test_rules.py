@@ -0,0 +1,64 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import pytest
+
+from document_helpers.rules import Rules
+
+
+def test_default_rules():
+    rules = Rules.load()
+    tags, correspondents, document_types = rules.apply(
+        {"hetzner", "invoice", "gewerbe", "Red", "2019", "DOCT JGU", "other"}
+    )
+    assert tags == {"Gewerbe", "DOCT", "other"}
+    assert correspondents == ["Hetzner"]
+    assert document_types == ["Invoice"]
+    assert {"Hetzner", "JGU Mainz", "UBS"} <= rules.correspondents
+
+
+def test_case_insensitive():
+    rules = Rules(
+        ignore=["Red"],
+        aliases={"cern": "CERN"},
+        correspondents={"UBS": ["ubs"]},
+    )
+    assert rules.apply({"UBS", "red", "Cern"}) == ({"CERN"}, ["UBS"], [])
+
+    rules = Rules(correspondents={"UBS": ["ubs"]}, case_sensitive=True)
+    assert rules.apply({"UBS"}) == ({"UBS"}, [], [])
+
+
+def test_patterns():
+    rules = Rules(
+        document_types={"Invoice": ["invoice"]},
+        patterns=[
+            {"match": r"\d{4}(-\d{2}){0,2}", "ignore": True},
+            {"match": "rechnung.*", "document_type": "Invoice"},
+            {"match": "steuer (\\d+)", "tag": "Steuer"},
+        ],
+    )
+    assert rules.apply({"2020-12-28", "Rechnung 2021", "steuer 2019", "x2019"}) == (
+        {"Steuer", "x2019"},
+        [],
+        ["Invoice"],
+    )
+    # exact rules win over patterns
+    assert rules.apply({"invoice"}) == (set(), [], ["Invoice"])
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        Rules(ignore=["ubs"], correspondents={"UBS": ["UBS"]})
+    with pytest.raises(ValueError):
+        Rules(patterns=[{"match": "x", "ignore": True, "tag": "y"}])
+
+
+def test_load_yaml(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "rules.yaml"
+    path.write_text("correspondents:\n  ING: [ing]\nignore: [m]\n")
+    rules = Rules.load(path)
+    assert rules.apply({"ING", "M", "x"}) == ({"x"}, ["ING"], [])
@@ -0,0 +1,79 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import pytest
+
+from document_helpers import sort
+from document_helpers.sort import plan_moves, sort_files
+
+FAKE_TAG = """#!/bin/sh
+if [ "$1" = "--list" ]; then
+    shift 2
+    for f in "$@"; do
+        printf '%s\\n' "$f"
+    done
+elif [ "$1" = "--set" ]; then
+    tags="$2"
+    shift 2
+    for f in "$@"; do
+        printf '%s' "$tags" > "$f.tags"
+    done
+fi
+"""
+
+
+@pytest.fixture
+def tags_exe(tmp_path):
+    exe = tmp_path / "tag"
+    exe.write_text(FAKE_TAG)
+    exe.chmod(0o755)
+    return str(exe)
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(path.name)
+    return str(path)
+
+
+def test_plan_moves_collisions(tmp_path, tags_exe):
+    out = tmp_path / "out"
+    first = touch(tmp_path / "a" / "2021-01-01--One__x.pdf")
+    second = touch(tmp_path / "b" / "2021-01-01--One__x.pdf")
+    third = touch(tmp_path / "a" / "2021-01-02--Two.pdf")
+    fourth = touch(tmp_path / "a" / "2021-01-03--Three.pdf")
+    touch(out / "2021" / "01" / "2021-01-02--Two.pdf")
+
+    plans = plan_moves([first, second, third, fourth], str(out), tags_exe)
+
+    # the second file would overwrite the first, the third an existing file
+    assert [p.src for p in plans] == [first, fourth]
+    assert plans[0].dest == str(out / "2021" / "01" / "2021-01-01--One__x.pdf")
+    assert plans[0].tags == {"x"}
+
+
+def test_sort_files_move_failure(tmp_path, tags_exe, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    good = touch(tmp_path / "in" / "2021-01-01--One__x.pdf")
+    bad = touch(tmp_path / "in" / "2021-01-02--Two__y.pdf")
+
+    real_move = sort.shutil.move
+
+    def move(src, dest):
+        if src == bad:
+            raise PermissionError("nope")
+        return real_move(src, dest)
+
+    monkeypatch.setattr(sort.shutil, "move", move)
+    sort_files([good, bad], str(out), False, tags_exe, jobs=2)
+
+    dest = out / "2021" / "01" / "2021-01-01--One__x.pdf"
+    assert dest.exists()
+    assert (out / "2021" / "01" / "2021-01-01--One__x.pdf.tags").read_text() == "x"
+    # the failed file stays where it was and is not tagged
+    assert os.path.exists(bad)
+    assert not os.path.exists(bad + ".tags")
+    assert not (out / "2021" / "01" / "2021-01-02--Two__y.pdf.tags").exists()
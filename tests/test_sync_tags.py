@@ -0,0 +1,64 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+from document_helpers import sync_tags
+from document_helpers.sync_tags import bulk_edit, plan_bulk_edits
+
+
+def test_plan_groups_by_tag():
+    current = {1: set(), 2: set(), 3: {5}}
+    desired = {1: {5}, 2: {5}, 3: {5}}
+
+    edits = plan_bulk_edits(current, desired)
+    assert edits == [("add_tag", {"tag": 5}, [1, 2])]
+
+
+def test_plan_groups_by_set():
+    current = {1: set(), 2: set(), 3: set()}
+    desired = {1: {5, 6, 7}, 2: {5, 6, 7}, 3: {5, 6, 7}}
+
+    edits = plan_bulk_edits(current, desired)
+    assert edits == [
+        ("modify_tags", {"add_tags": [5, 6, 7], "remove_tags": []}, [1, 2, 3])
+    ]
+
+
+def test_plan_prune():
+    current = {1: {1, 2, 9}, 2: {9}}
+    desired = {1: {2}, 2: {9}}
+
+    assert plan_bulk_edits(current, desired) == []
+
+    edits = plan_bulk_edits(current, desired, prune=True)
+    assert edits == [("modify_tags", {"add_tags": [], "remove_tags": [1, 9]}, [1])]
+
+    edits = plan_bulk_edits(current, desired, prune=True, keep={1})
+    assert edits == [("remove_tag", {"tag": 9}, [1])]
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, path, json):
+        self.posts.append((path, json))
+        return FakeResponse()
+
+
+def test_bulk_edit_chunks(monkeypatch):
+    monkeypatch.setattr(sync_tags, "BULK_SIZE", 2)
+    client = FakeClient()
+
+    bulk_edit(client, [1, 2, 3], "add_tag", {"tag": 5})
+
+    assert [p for p, _ in client.posts] == ["/api/documents/bulk_edit/"] * 2
+    assert [j["documents"] for _, j in client.posts] == [[1, 2], [3]]
+    assert all(j["method"] == "add_tag" for _, j in client.posts)
+    assert all(j["parameters"] == {"tag": 5} for _, j in client.posts)
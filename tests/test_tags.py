@@ -0,0 +1,138 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import plistlib
+
+import pytest
+from click.testing import CliRunner
+
+from document_helpers import sync_tags
+from document_helpers import tags as tags_module
+from document_helpers.tags import (
+    decode_tags,
+    encode_tags,
+    get_tags_many,
+    set_tags_many,
+    xattr_get_tags,
+    xattr_set_tags,
+)
+
+FAKE_TAG = """#!/bin/sh
+echo "$@" >> "{log}"
+if [ "$1" = "--list" ]; then
+    shift 2
+    for f in "$@"; do
+        if [ -s "$f.tags" ]; then
+            printf '%s\\t%s\\n' "$f" "$(cat "$f.tags")"
+        else
+            printf '%s\\n' "$f"
+        fi
+    done
+elif [ "$1" = "--set" ]; then
+    tags="$2"
+    shift 2
+    for f in "$@"; do
+        printf '%s' "$tags" > "$f.tags"
+    done
+fi
+"""
+
+
+@pytest.fixture
+def tags_exe(tmp_path):
+    exe = tmp_path / "tag"
+    exe.write_text(FAKE_TAG.format(log=tmp_path / "calls.log"))
+    exe.chmod(0o755)
+    return str(exe)
+
+
+def calls(tags_exe):
+    with open(os.path.join(os.path.dirname(tags_exe), "calls.log")) as fh:
+        return fh.read().strip().split("\n")
+
+
+def test_get_tags_many(tmp_path, tags_exe):
+    files = [str(tmp_path / "a.pdf"), str(tmp_path / "b c.pdf")]
+    for f in files:
+        open(f, "w").close()
+    with open(files[1] + ".tags", "w") as fh:
+        fh.write("Tag One,two")
+
+    res = get_tags_many(files, tags_exe=tags_exe)
+    assert res == {files[0]: set(), files[1]: set(["Tag One", "two"])}
+    assert len(calls(tags_exe)) == 1
+
+
+def test_set_tags_many(tmp_path, tags_exe):
+    files = [str(tmp_path / n) for n in ["a.pdf", "b.pdf", "c.pdf"]]
+    for f in files:
+        open(f, "w").close()
+
+    set_tags_many(
+        {files[0]: {"x", "y"}, files[1]: {"y", "x"}, files[2]: {"z"}},
+        tags_exe=tags_exe,
+    )
+    # one call per distinct tag set
+    assert len(calls(tags_exe)) == 2
+
+    res = get_tags_many(files, tags_exe=tags_exe)
+    assert res[files[0]] == res[files[1]] == set(["x", "y"])
+    assert res[files[2]] == set(["z"])
+
+
+def test_decode_encode_tags():
+    raw = plistlib.dumps(["Red\n6", "invoice"], fmt=plistlib.FMT_BINARY)
+    assert decode_tags(raw) == set(["Red", "invoice"])
+
+    # colors of existing tags survive, new tags have none
+    raw = encode_tags(set(["Red", "google"]), previous=["Red\n6", "invoice"])
+    assert plistlib.loads(raw) == ["Red\n6", "google"]
+
+
+def test_xattr_tags(tmp_path):
+    f = str(tmp_path / "a.pdf")
+    open(f, "w").close()
+    try:
+        xattr_set_tags(f, set(["Steuer FR", "google"]))
+    except OSError:
+        pytest.skip("no extended attribute support")
+
+    assert xattr_get_tags(f) == set(["Steuer FR", "google"])
+
+    xattr_set_tags(f, set())
+    assert xattr_get_tags(f) == set()
+
+
+def test_auto_backend_prefers_xattr(tmp_path, monkeypatch):
+    if not tags_module.have_xattr():
+        pytest.skip("no extended attribute support")
+    monkeypatch.setattr(tags_module, "BACKEND", "auto")
+
+    f = str(tmp_path / "a.pdf")
+    open(f, "w").close()
+    try:
+        set_tags_many({f: set(["x"])})
+    except OSError:
+        pytest.skip("no extended attribute support")
+    assert get_tags_many([f]) == {f: set(["x"])}
+
+
+def test_sync_tags_tags_renamed_files_on_error(tmp_path, tags_exe, monkeypatch):
+    files = [str(tmp_path / "2021-01-01--One__a.pdf"), str(tmp_path / "Two.pdf")]
+    for f in files:
+        open(f, "w").close()
+
+    sync = sync_tags.sync
+
+    def failing_sync(file, *args, **kwargs):
+        if file == files[1]:
+            raise OSError("gone")
+        return sync(file, *args, **kwargs)
+
+    monkeypatch.setattr(sync_tags, "sync", failing_sync)
+    CliRunner().invoke(sync_tags.main, ["--tags", tags_exe, *files])
+
+    # the first file was renamed before the error and still got its tags
+    assert get_tags_many([files[0]], tags_exe=tags_exe) == {files[0]: set(["a"])}
@@ -0,0 +1,92 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import threading
+
+from document_helpers.tasks import TaskTracker
+
+
+class FakeClient:
+    def __init__(self, listed, single):
+        self.listed = listed
+        self.single = single
+        self.calls = []
+
+    def get_json(self, path, params=None):
+        self.calls.append(params)
+        if params is None:
+            return self.listed
+        return [t for t in self.single if t["task_id"] == params["task_id"]]
+
+
+def test_poll():
+    client = FakeClient(
+        listed=[
+            {"task_id": "a", "status": "SUCCESS", "related_document": 1},
+            {"task_id": "b", "status": "STARTED"},
+            {"task_id": "other", "status": "FAILURE"},
+        ],
+        single=[{"task_id": "c", "status": "FAILURE", "result": "broken"}],
+    )
+    done = []
+    tracker = TaskTracker(
+        client, lambda path, task: done.append((path, task["status"])), interval=60
+    )
+    tracker.add("a", "a.pdf")
+    tracker.add("b", "b.pdf")
+    tracker.add("c", "c.pdf")
+
+    assert tracker.poll() == 2
+    assert sorted(done) == [("a.pdf", "SUCCESS"), ("c.pdf", "FAILURE")]
+    # one list request, and a single lookup for the id missing from it
+    assert client.calls == [None, {"task_id": "c"}]
+    assert len(tracker) == 1
+
+    assert tracker.close(timeout=0.5) == ["b.pdf"]
+
+
+class SlowClient:
+    # the first request hangs until released, later ones fail
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def get_json(self, path, params=None):
+        self.calls += 1
+        if self.calls == 1:
+            self.started.set()
+            self.release.wait(5)
+            return self.tasks
+        raise OSError("server gone")
+
+
+def test_close_reports_finished_without_waiting():
+    client = FakeClient(listed=[{"task_id": "a", "status": "SUCCESS"}], single=[])
+    done = []
+    tracker = TaskTracker(client, lambda path, task: done.append(path), interval=60)
+    tracker.add("a", "a.pdf")
+    tracker.add("b", "b.pdf")
+
+    assert tracker.close(timeout=0) == ["b.pdf"]
+    assert done == ["a.pdf"]
+
+
+def test_no_callbacks_after_close():
+    client = SlowClient([{"task_id": "a", "status": "SUCCESS"}])
+    done = []
+    tracker = TaskTracker(client, lambda path, task: done.append(path), interval=0.01)
+    tracker.add("a", "a.pdf")
+    # the background thread is stuck in its first request
+    assert client.started.wait(1)
+
+    assert tracker.close(timeout=0.1) == ["a.pdf"]
+
+    # the request comes back after close() gave up on the task
+    client.release.set()
+    tracker.thread.join(1)
+    assert not tracker.thread.is_alive()
+    assert done == []
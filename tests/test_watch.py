@@ -0,0 +1,76 @@
+import sys, os
+
+parent = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, parent + "/../")
+
+import threading
+import time
+
+import pytest
+
+from document_helpers.watch import InotifyWatcher, watch
+
+
+def test_watch_waits_for_writes_to_settle(tmp_path):
+    path = tmp_path / "scan.pdf"
+    done = []
+
+    def scanner():
+        time.sleep(0.2)
+        with open(path, "wb") as fh:
+            for _ in range(30):
+                fh.write(b"x" * 100)
+                fh.flush()
+                time.sleep(0.1)
+        done.append(time.monotonic())
+
+    thread = threading.Thread(target=scanner)
+    thread.start()
+    try:
+        batches = watch(str(tmp_path), settle=0.5, polling=True)
+        batch = next(batches)
+        found = time.monotonic()
+        batches.close()
+    finally:
+        thread.join()
+
+    assert batch == [str(path)]
+    # only once the file stopped growing, and stayed unchanged for a while
+    assert len(done) == 1
+    assert found - done[0] >= 0.5
+    assert path.stat().st_size == 3000
+
+
+def poll_until(watcher, path, timeout=5):
+    touched = []
+    deadline = time.monotonic() + timeout
+    while path not in touched and time.monotonic() < deadline:
+        touched += watcher.poll(0.2)
+    return touched
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify")
+def test_inotify_new_subdirectory(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except (OSError, AttributeError):
+        pytest.skip("inotify not available")
+
+    try:
+        # the file lands before the new directory is watched
+        os.makedirs(tmp_path / "a" / "b")
+        (tmp_path / "a" / "b" / "early.pdf").write_text("x")
+        assert str(tmp_path / "a" / "b" / "early.pdf") in poll_until(
+            watcher, str(tmp_path / "a" / "b" / "early.pdf")
+        )
+
+        # and afterwards through the watch on it
+        late = tmp_path / "a" / "b" / "late.pdf"
+        late.write_text("x")
+        assert str(late) in poll_until(watcher, str(late))
+
+        hidden = tmp_path / "a" / ".hidden.pdf"
+        hidden.write_text("x")
+        assert str(hidden) not in poll_until(watcher, str(hidden), timeout=0.5)
+    finally:
+        watcher.close()